@@ -1,4 +1,10 @@
 import hou
+import numpy
+
+import ikmath
+import keyframeutils
+import rotmath
+import Skeleton
 
 # construct a python Bone object by calling the constructor with an existing bone in the scene
 # original hou.ObjNode object can be accessed through Bone.node
@@ -14,9 +20,133 @@ import hou
 
 
 def io_sort(sel, reverse=True):
-    def io_compare(x, y):
-        return 1 if x in y.inputAncestors() else -1
-    return sorted(sel, io_compare, reverse=reverse)
+    return hierarchy_sort(sel, roots_first=reverse)
+
+
+def _node_of(item):
+    return item.node if isinstance(item, Bone) else item
+
+
+def hierarchy_parents(items):
+    """Map each item to the index of its nearest ancestor within items, or None for roots.
+
+    items can be hou.Nodes or Bones. Ancestors are followed through first inputs, so nodes that aren't part of items
+    (nulls, non-bone parents...) are walked through. Every node is only ever visited once."""
+
+    members = {}
+    for idx, item in enumerate(items):
+        members[_node_of(item).sessionId()] = idx
+
+    # nearest member ancestor of every node walked through so far
+    nearest = {}
+    parents = []
+
+    for item in items:
+        walked = []
+        result = None
+        cur = _node_of(item)
+
+        while True:
+            inputs = cur.inputs()
+            if not inputs or inputs[0] is None:
+                break
+
+            cur = inputs[0]
+            sid = cur.sessionId()
+
+            if sid in members:
+                result = members[sid]
+                break
+            if sid in nearest:
+                result = nearest[sid]
+                break
+
+            walked.append(sid)
+
+        for sid in walked:
+            nearest[sid] = result
+
+        parents.append(result)
+
+    return parents
+
+
+def hierarchy_sort(items, roots_first=True):
+    """Sort nodes or Bones by hierarchy.
+
+    With roots_first every item comes after its ancestors (depth first, so a chain stays together), otherwise every
+    item comes before its ancestors. Siblings and separate hierarchies keep the order they were given in. Branching
+    skeletons and non-bone parents are handled, and the sort is linear in the number of items."""
+
+    items = tuple(items)
+    parents = hierarchy_parents(items)
+
+    children = [[] for _ in items]
+    roots = []
+
+    for idx, parent in enumerate(parents):
+        if parent is None:
+            roots.append(idx)
+        else:
+            children[parent].append(idx)
+
+    order = []
+
+    if roots_first:
+        stack = roots[::-1]
+        while stack:
+            idx = stack.pop()
+            order.append(idx)
+            stack.extend(children[idx][::-1])
+    else:
+        # post order, children (in the order given) before their parent
+        stack = [(idx, False) for idx in roots[::-1]]
+        while stack:
+            idx, expanded = stack.pop()
+            if expanded:
+                order.append(idx)
+                continue
+            stack.append((idx, True))
+            stack.extend((c, False) for c in children[idx][::-1])
+
+    return tuple(items[idx] for idx in order)
+
+
+# shared by every Bone, created on first use since Skeleton imports this module, see solver_tracks()
+_solver_index = None
+
+
+def _index(nodes=()):
+    """the shared Skeleton.SolverIndex, built from the given nodes on first use"""
+    global _solver_index
+
+    if _solver_index is None:
+        _solver_index = Skeleton.SolverIndex.fromBones(nodes)
+
+    return _solver_index
+
+
+def _solver_entry(node):
+    """the Skeleton.SolverEntry of the solver driving node, or None. Nodes the shared index doesn't cover yet are
+    looked up through their references once and indexed"""
+    index = _index((node,))
+    entry = index.entry_of(node)
+
+    if entry is None:
+        index.update((node,))
+        entry = index.entry_of(node)
+
+    return entry
+
+
+def solver_tracks(kin):
+    """Map the name of every bone driven by the inversekin solver kin to its tracks.
+
+    The table hangs off the solver's Skeleton.SolverEntry, so it is built once per solver and shared by every bone of
+    the chain. The index re-reads the entry when one of the solver's path parms changes or drops it when the solver is
+    deleted."""
+    return _index().solver_entry(kin).tracks
+
 
 class Bone(object):
     def __init__(self, bone_obj=None, context=None):
@@ -36,6 +166,14 @@ class Bone(object):
         self.node = bone_obj
         self.prev_child = None
         self.prev_input = None
+        # set by Skeleton.Skeleton when this bone belongs to one, topology queries are then answered from its cache
+        self.skeleton = None
+
+    def _borrowed(self):
+        """the skeleton to take topology from, if this bone is still part of it"""
+        if self.skeleton is not None and self.skeleton.index(self) is not None:
+            return self.skeleton
+        return None
 
     @property
     def xform(self):
@@ -76,6 +214,10 @@ class Bone(object):
 
     @property
     def parent(self):
+        skel = self._borrowed()
+        if skel is not None:
+            return skel.parent_of(self)
+
         try:
             input_node = self.node.inputs()[0]
             if input_node.type().name() == "bone":
@@ -88,6 +230,10 @@ class Bone(object):
 
     @property
     def child(self):
+        skel = self._borrowed()
+        if skel is not None:
+            return skel.child_of(self)
+
         try:
             output = self.node.outputs()[0]
             if output.type().name() == "bone":
@@ -168,29 +314,36 @@ class Bone(object):
                 self.child.xform = cache_child_xform * mat_translate
                 self.child.move_tip(cache_child_tip, child_xform=grandchild_xform if grandchild_xform else None)
 
+    def drag_tip(self, compensate=True):
+        """start an interactive move_tip(), see BoneDrag"""
+        return BoneDrag(self, "tip", compensate)
+
+    def drag_root(self, compensate=True):
+        """start an interactive move_root(), see BoneDrag"""
+        return BoneDrag(self, "root", compensate)
 
     @property
     def ik_solver(self):
-        for n in self.node.references():
-            if n.type().name() == "inversekin":
-                return n
-        return False
+        skel = self._borrowed()
+        if skel is not None:
+            return skel.solver_of(self)
+
+        entry = _solver_entry(self.node)
+        return entry.solver if entry else False
 
     @property
     def ik_chain(self):
-        kin = self.ik_solver
-
-        if not kin:
-            return False
+        skel = self._borrowed()
+        if skel is not None:
+            return skel.ik_chain(self)
 
-        tup = tuple(Bone(n) for n in kin.dependents() if n.type().name() == "bone")
+        entry = _solver_entry(self.node)
 
-        # this is also bad! at the moment this and downstream methods assume the result of hou.Node.dependents()
-        # to be consistently ordered in terms of hierarchy...
-        # TODO implement sorting of a node tuple by hierarchy
-        tup = tup[::-1]
+        if not entry:
+            return False
 
-        return IK_Chain(tup)
+        # the chain is read from the solver's root and end bone once, then shared through the index
+        return IK_Chain(tuple(Bone(n) for n in entry.chain))
 
     @property
     def fk_rotates(self):
@@ -202,19 +355,26 @@ class Bone(object):
             if not p.isLocked():
                 p.set(vec3[i])
 
-    # this doesn't really belong in this file, but I need it NOW!
-    def ik_tracks(self):
-        kin = self.ik_solver
+    def fk_quats(self, frames=None):
+        """the bone's local rotates as an (N, 4) array of quaternions, one per frame (the current frame by default),
+        respecting the bone's rotate order. See rotmath for the layout"""
+        if frames is None:
+            frames = (hou.frame(),)
 
-        out_tracks = ()
+        tup = self.node.parmTuple("r")
+        rotates = numpy.array([tup.evalAtFrame(f) for f in frames], dtype=float)
 
-        for track in kin.tracks():
-            strip_front = track.name().split("/")[-1]
-            strip_channel = strip_front.split(":")[0]
-            if strip_channel == self.node.name():
-                out_tracks += (track,)
+        return rotmath.eulerToQuat(rotates, self.rotate_order)
 
-        return out_tracks
+    def set_fk_quat(self, quat):
+        """set the fk rotates from a single quaternion, keeping the result closest to the current rotates"""
+        order = self.rotate_order
+        rotates = rotmath.closestEuler(rotmath.quatToEuler(quat, order), self.fk_rotates, order)[0]
+        self.fk_rotates = tuple(rotates)
+
+    # this doesn't really belong in this file, but I need it NOW!
+    def ik_tracks(self):
+        return solver_tracks(self.ik_solver).get(self.node.name(), ())
 
     @property
     def ik_rotates(self):
@@ -223,7 +383,7 @@ class Bone(object):
         in_blend = kin.parm("blend").eval()
         kin.parm("blend").set(1)
 
-        tracks = self.ik_tracks()
+        tracks = solver_tracks(kin).get(self.node.name(), ())
         values = ()
 
         for t in tracks:
@@ -234,9 +394,158 @@ class Bone(object):
         return values
 
 
+def _aim(world, length, target):
+    """a bone's world transform and length rotated and stretched so its tip lands on target, as move_tip() does"""
+    root = world.extractTranslates()
+    tip = hou.Vector3((0, 0, -length)) * world
+
+    rot = hou.hmath.buildRotate(world.extractRotates()).inverted()
+    vec1 = (tip - root).normalized() * rot
+    vec2 = (target - root).normalized() * rot
+
+    return vec1.matrixToRotateTo(vec2) * world, (target - root).length()
+
+
+def _tip_transform(world, length):
+    """the transform children of a bone inherit"""
+    return hou.hmath.buildTranslate(hou.Vector3((0, 0, -length))) * world
+
+
+class _Cached(object):
+    """the transforms of a node at the start of a drag"""
+    __slots__ = ("node", "pre", "parm_inv", "world", "length")
+
+    def __init__(self, node):
+        self.node = node
+        self.pre = node.preTransform()
+        self.parm_inv = node.parmTransform().inverted()
+        self.world = node.worldTransform()
+        self.length = node.parm("length").eval() if node.parm("length") is not None else None
+
+    def place(self, world, parent_world, length=None):
+        self.node.setPreTransform(self.parm_inv * world * parent_world.inverted())
+        if length is not None:
+            self.node.parm("length").set(length)
+
+    def restore(self):
+        self.node.setPreTransform(self.pre)
+        if self.length is not None:
+            self.node.parm("length").set(self.length)
+
+
+class BoneDrag(object):
+    """An interactive Bone.move_tip() / move_root(), e.g. driven by a viewport state, that ends up as one undo entry.
+
+    Like fkcreate.CacheSlider, every update() is applied with undos disabled, and release() puts the bones back to
+    where they started and applies the last position again within a single undo group. Only the dragged bone and the
+    bones it compensates are touched, and all of them are placed from the transforms cached when the drag started.
+
+    drag = some_bone.drag_tip()
+    drag.update(pos)  # on every mouse move
+    drag.release()    # or drag.cancel()"""
+
+    def __init__(self, bone, end="tip", compensate=True):
+        if end not in ("tip", "root"):
+            raise ValueError("end must be either 'tip' or 'root'")
+
+        # moving a root compensated by a parent bone is moving the parent's tip
+        if end == "root" and compensate and isinstance(bone.parent, Bone):
+            bone, end = bone.parent, "tip"
+
+        self.bone = bone
+        self.end = end
+        self.compensate = compensate
+        self.target = None
+
+        self.cached = _Cached(bone.node)
+        self.tip = hou.Vector3((0, 0, -self.cached.length)) * self.cached.world
+        self.parent_world = bone.node.parentAndSubnetTransform()
+
+        child = bone.child if compensate else None
+        self.child = _Cached(child.node) if child else None
+        self.child_tip = child.tip if child else None
+
+        grandchild = child.child if child and end == "tip" else None
+        self.grandchild = _Cached(grandchild.node) if grandchild else None
+
+        self.parent = None
+        if end == "root":
+            parent = bone.parent
+            if parent is None:
+                raise hou.Error(bone.name + " has no parent to move")
+            self.parent = _node_of(parent)
+            self.parent_start = self.parent.worldTransform()
+
+        self.undogroup = "Move Bone Tip" if end == "tip" else "Move Bone Root"
+
+    def _apply(self, target):
+        target = hou.Vector3(target)
+
+        if self.end == "root":
+            move = hou.hmath.buildTranslate(target - self.cached.world.extractTranslates())
+            self.parent.setWorldTransform(self.parent_start * move)
+
+            if self.compensate:
+                # keep the tip in place, and the child where it was
+                world, length = _aim(self.cached.world * move, self.cached.length, self.tip)
+                self.cached.place(world, self.parent_world * move, length)
+
+                if self.child:
+                    self.child.place(self.child.world, _tip_transform(world, length))
+            return
+
+        world, length = _aim(self.cached.world, self.cached.length, target)
+        self.cached.place(world, self.parent_world, length)
+
+        if not self.child:
+            return
+
+        # the child follows the tip but keeps its own tip in place, the grandchild doesn't move
+        child_world, child_length = _aim(self.child.world * hou.hmath.buildTranslate(target - self.tip),
+                                         self.child.length, self.child_tip)
+        self.child.place(child_world, _tip_transform(world, length), child_length)
+
+        if self.grandchild:
+            self.grandchild.place(self.grandchild.world, _tip_transform(child_world, child_length))
+
+    def _restore(self):
+        if self.parent is not None:
+            self.parent.setWorldTransform(self.parent_start)
+
+        for cached in (self.cached, self.child, self.grandchild):
+            if cached is not None:
+                cached.restore()
+
+    def update(self, target):
+        """move the dragged end to target, without adding to the undo history"""
+        self.target = target
+        with hou.undos.disabler():
+            self._apply(target)
+
+    def release(self):
+        """commit the last update() as a single undo entry"""
+        if self.target is None:
+            return
+
+        with hou.undos.disabler():
+            self._restore()
+
+        with hou.undos.group(self.undogroup):
+            self._apply(self.target)
+
+        self.target = None
+
+    def cancel(self):
+        """put everything back where it was when the drag started"""
+        with hou.undos.disabler():
+            self._restore()
+
+        self.target = None
+
+
 class IK_Chain(object):
     def __init__(self, bones):
-        self.bones = io_sort(bones);
+        self.bones = hierarchy_sort(bones)
         # don't like this... need to do some checking that all bones belong to the same solver in case an instance is created directly (rather than by and instance of the Bone class)
         self.solver = bones[0].ik_solver
         self.length = len(bones)
@@ -248,46 +557,210 @@ class IK_Chain(object):
             b.fk_rotates = b.ik_rotates
 
     def ik_to_fk(self):
-        if self.length > 2:
-            raise hou.Error("Only two-bone chains are currently supported for IK->FK matching")
-
         self.solver.parm("blend").set(0)
 
         self.set_end_pos()
         self.set_twist_pos()
 
-    def set_twist_pos(self, dist=None):
+    def bake_fk_to_ik(self, frames):
+        """Match the FK rotates to the IK solution at every frame and key them.
+
+        The solver's blend is switched to IK once (with undos disabled) while every bone's tracks are sampled at
+        every frame, then restored. The rotates are euler filtered and keyed in a single undo group. Bones without
+        all three rotate tracks, or with all rotates locked, are skipped."""
+        frames = tuple(frames)
+
+        bones = ()
+        tracks = ()
+        for b in self.bones:
+            bone_tracks = b.ik_tracks()
+            # the euler filter needs complete rotates
+            if len(bone_tracks) != 3 or all(p.isLocked() for p in b.node.parmTuple("r")):
+                continue
+            bones += (b,)
+            tracks += (bone_tracks,)
+
+        if not bones:
+            return 0
+
+        values = tuple(numpy.empty((len(frames), 3)) for _ in tracks)
+
+        blend = self.solver.parm("blend")
+
+        with hou.undos.disabler():
+            in_blend = blend.eval()
+            blend.set(1)
+            try:
+                for f_idx, frame in enumerate(frames):
+                    for b_idx, bone_tracks in enumerate(tracks):
+                        values[b_idx][f_idx] = [t.evalAtFrame(frame) for t in bone_tracks]
+            finally:
+                blend.set(in_blend)
+
+        values = tuple(rotmath.eulerFilter(v, b.rotate_order) for v, b in zip(values, bones))
+        tuples = tuple(b.node.parmTuple("r") for b in bones)
+
+        with hou.undos.group("Bake FK to IK"):
+            return keyframeutils.keyParmTuples(tuples, frames, values)
+
+    def bake_ik_to_fk(self, frames, offset=0.001, dist=None):
+        """Match the IK goals to the FK pose at every frame and key them.
+
+        The FK pose is computed from the bones' parms for all frames at once (see Skeleton.evaluate()), so nothing
+        needs to cook per frame. The end and twist goal positions are then derived as in set_end_pos() and
+        set_twist_pos() and keyed in a single undo group."""
+        frames = tuple(frames)
+
+        pose, order = self._pose(frames)
+        joints = ikmath.chainJoints(pose.roots[:, order], pose.tips[:, order])
+
+        goals = ((self.end_goal, ikmath.endGoalPositions(joints, offset)),)
+        if self.twist_goal:
+            goals += ((self.twist_goal, ikmath.twistGoalPositions(joints, dist)),)
+
+        tuples = ()
+        values = ()
+
+        for goal, positions in goals:
+            world = numpy.tile(numpy.eye(4), (len(frames), 1, 1))
+            world[:, 3, :3] = positions
+
+            t, r = Skeleton.placementValues(goal, world, frames)
+            tuples += (goal.parmTuple("t"), goal.parmTuple("r"))
+            values += (t, r)
+
+        with hou.undos.group("Bake IK to FK"):
+            self.solver.parm("blend").set(0)
+            return keyframeutils.keyParmTuples(tuples, frames, values)
+
+    def _pose(self, frames):
+        """the FK pose of the chain over frames, and the pose index of each of self.bones"""
+        skel = Skeleton.Skeleton(tuple(b.node for b in self.bones))
+        try:
+            pose = skel.evaluate(frames)
+            order = [skel.index(b) for b in self.bones]
+        finally:
+            skel.release()
+
+        return pose, order
+
+    def _joints(self, pose=None, frame_idx=0):
+        """(1, bones + 1, 3) joint positions, read from a Skeleton.SkeletonPose when one is given"""
+        if pose is not None:
+            order = [pose.skeleton.index(b) for b in self.bones]
+            return ikmath.chainJoints(pose.roots[frame_idx:frame_idx + 1, order],
+                                      pose.tips[frame_idx:frame_idx + 1, order])
+
+        roots = numpy.array([[tuple(b.root) for b in self.bones]])
+        tips = numpy.array([[tuple(b.tip) for b in self.bones]])
+
+        return ikmath.chainJoints(roots, tips)
+
+    def set_twist_pos(self, dist=None, pose=None, frame_idx=0):
         if not self.twist_goal:
             return False
 
-        bone1 = self.bones[0]
-        bone2 = self.bones[1]
+        new_pos = ikmath.twistGoalPositions(self._joints(pose, frame_idx), dist)[0]
+        mat = hou.hmath.buildTranslate(hou.Vector3(new_pos.tolist()))
 
-        # this is given as a sensible distance to place the twist goal from the end of the bone... may revise
-        if not dist:
-            dist = hou.Vector3(bone1.tip - bone1.root).length()
+        self.twist_goal.setWorldTransform(mat)
 
-        # get vectors for computing cross product
-        a = hou.Vector3(bone1.tip - bone1.root).normalized()
-        b = hou.Vector3(bone2.tip - bone2.root).normalized()
-        c = hou.Vector3(bone1.root - bone2.tip).normalized()
+    def set_end_pos(self, offset=0.001, pose=None, frame_idx=0):
+        end_pos = ikmath.endGoalPositions(self._joints(pose, frame_idx), offset)[0]
+        self.end_goal.setWorldTransform(hou.hmath.buildTranslate(hou.Vector3(end_pos.tolist())))
 
-        normal = a.cross(b)
+    def solve_fk(self, targets, frames=None, poles=None):
+        """FK rotates that bring the end of the chain to targets, solved with ikmath.fabrik() from the chain's FK pose.
 
-        pole_dir = normal.cross(c)
+        targets (and the optional poles for the bend to face) are (frames, 3) world positions, one per frame (the
+        current frame by default). Returns one (frames, 3) array of rotates per bone, euler filtered over the frames."""
+        if frames is None:
+            frames = (hou.frame(),)
+        frames = tuple(frames)
 
-        new_pos = bone1.tip + (pole_dir * dist)
-        mat = hou.hmath.buildTranslate(new_pos)
+        pose, order = self._pose(frames)
+        joints = ikmath.chainJoints(pose.roots[:, order], pose.tips[:, order])
+        solved = ikmath.fabrik(joints, numpy.reshape(targets, (-1, 3)),
+                               None if poles is None else numpy.reshape(poles, (-1, 3)))
 
-        self.twist_goal.setWorldTransform(mat)
+        worlds = ()
+
+        for i, idx in enumerate(order):
+            old_world = pose.matrices[:, idx]
+
+            # rotate the bone along the shortest arc from its current direction onto the solved one
+            align = ikmath.alignMatrices(joints[:, i + 1] - joints[:, i], solved[:, i + 1] - solved[:, i])
+
+            world = old_world.copy()
+            world[:, :3, :3] = numpy.matmul(old_world[:, :3, :3], numpy.transpose(align, (0, 2, 1)))
+            world[:, 3, :3] = solved[:, i]
+
+            worlds += (world,)
+
+        return self._fk_rotates(pose, order, worlds)
+
+    def _fk_rotates(self, pose, order, worlds):
+        """the rotates that give every bone the matching (frames, 4, 4) world transform, euler filtered over the
+        frames. Every bone inherits from the new world transform of the bone before it"""
+        out = ()
+
+        for i, idx in enumerate(order):
+            if i == 0:
+                inherited = pose.inherited(idx)
+            else:
+                offset = numpy.tile(numpy.eye(4), (len(pose.frames), 1, 1))
+                offset[:, 3, 2] = -pose.lengths[:, order[i - 1]]
+                inherited = numpy.matmul(offset, worlds[i - 1])
+
+            parm = numpy.matmul(worlds[i], numpy.linalg.inv(numpy.matmul(pose.pre[idx][None], inherited)))
+
+            bone_order = self.bones[i].rotate_order
+            rotates = rotmath.matrixToEuler(numpy.transpose(parm[:, :3, :3], (0, 2, 1)), bone_order)
+            out += (rotmath.eulerFilter(rotates, bone_order),)
+
+        return out
+
+    def roll_rotates(self, frames=None, axis="x"):
+        """FK rotates that roll every bone so its axis ("x" or "y") lies along the normal of the chain's best fit
+        plane, see ikmath.chainNormals(). The bones keep pointing where they do. Returns one (frames, 3) array per
+        bone"""
+        if frames is None:
+            frames = (hou.frame(),)
+        frames = tuple(frames)
+
+        pose, order = self._pose(frames)
+        joints = ikmath.chainJoints(pose.roots[:, order], pose.tips[:, order])
+        bases = ikmath.boneBases(joints, ikmath.chainNormals(joints), axis)
+
+        worlds = ()
+
+        for i, idx in enumerate(order):
+            world = pose.matrices[:, idx].copy()
+            world[:, :3, :3] = bases[:, i]
+            worlds += (world,)
+
+        return self._fk_rotates(pose, order, worlds)
+
+    def align_roll(self, axis="x", frames=None):
+        """Roll the bones onto the chain's plane, at the current frame or keyed at every given frame"""
+        rotates = self.roll_rotates(frames, axis)
+
+        if frames is None:
+            with hou.undos.group("Align Chain Roll"):
+                for b, r in zip(self.bones, rotates):
+                    b.fk_rotates = tuple(rotmath.closestEuler(r, b.fk_rotates, b.rotate_order)[0])
+            return
+
+        tuples = tuple(b.node.parmTuple("r") for b in self.bones)
 
-    def set_end_pos(self, offset=0.001):
-        offset_vec = hou.Vector3(self.bones[1].tip - self.bones[1].root).normalized() * offset
+        with hou.undos.group("Align Chain Roll"):
+            return keyframeutils.keyParmTuples(tuples, tuple(frames), rotates)
 
-        end_pos = hou.hmath.buildTranslate(self.bones[1].tip + offset_vec)
-        self.end_goal.setWorldTransform(end_pos)
+    def snap_to(self, target, pole=None):
+        """pose the chain's FK so its end reaches target at the current frame"""
+        rotates = self.solve_fk(numpy.reshape(target, (1, 3)), poles=pole)
 
-# best fit from points:
-# pts = tuple(pt.position() for pt in geo.points())
-    # u, s, v = numpy.linalg.svd(pts)
-# v[2] is the normal of our best fit plane
+        with hou.undos.group("Snap Chain"):
+            for b, r in zip(self.bones, rotates):
+                order = b.rotate_order
+                b.fk_rotates = tuple(rotmath.closestEuler(r, b.fk_rotates, order)[0])
@@ -0,0 +1,796 @@
+import hou
+import numpy
+
+import Bone as bonemodule
+import channelbake
+import ikmath
+import rotmath
+
+# A Skeleton wraps a whole bone network once, rather than every Bone.parent / Bone.child / Bone.ik_chain access
+# querying hou again and creating new Bone wrappers:
+#
+# skel = Skeleton(hou.node("/obj/rig"))           # every bone inside the subnet
+# skel = Skeleton(hou.selectedNodes())            # or any set of nodes, non-bones are ignored
+#
+# The bones are stored in hierarchy order (roots first). skel.parents and skel.depths are numpy arrays indexed the same
+# way, skel.children holds a tuple of child indices per bone. skel.bones holds one cached Bone per joint, attached to
+# the skeleton, so their parent, child, ik_solver and ik_chain properties are answered from here.
+#
+# skel.evaluate(frames) computes the world transforms of every bone at once, see SkeletonPose.
+#
+# SolverIndex maps every bone of a rig to its IK solver, chain and goals, see below.
+#
+# Node event callbacks on the bones (and the subnet) mark the skeleton stale when bones are renamed, rewired, created
+# or deleted, callbacks on the IK solvers do so when their path parms change. It is rebuilt lazily the next time it is
+# queried. Call release() to remove the callbacks when done.
+
+_BONE_EVENTS = (hou.nodeEventType.NameChanged,
+                hou.nodeEventType.InputRewired,
+                hou.nodeEventType.BeingDeleted)
+
+_CONTAINER_EVENTS = (hou.nodeEventType.ChildCreated,
+                     hou.nodeEventType.ChildDeleted)
+
+_SOLVER_EVENTS = (hou.nodeEventType.ParmTupleChanged,
+                  hou.nodeEventType.BeingDeleted)
+
+# evaluate() bakes up to this many frames in a single chunk without opening an interrupt dialog
+_QUIET_FRAMES = 100
+
+
+def _pathsChanged(kwargs):
+    """False for a solver event that can't change its chain or goals, these are defined by its path parms only"""
+    tup = kwargs.get("parm_tuple")
+    return tup is None or isinstance(tup.parmTemplate(), hou.StringParmTemplate)
+
+
+def _translateMatrices(t):
+    m = numpy.tile(numpy.eye(4), (len(t), 1, 1))
+    m[:, 3, :3] = t
+    return m
+
+
+def _checkPivotRotates(node, pr):
+    if numpy.any(pr):
+        raise hou.Error(node.path() + " has a pivot rotate, which is not supported")
+
+
+def localMatrices(t, r, s, rotate_order="xyz", transform_order="srt", p=None):
+    """Build (N, 4, 4) local transforms from (N, 3) arrays of translates, euler rotates (degrees) and scales.
+    Matrices use the row vector convention of hou.Matrix4, components are applied in transform_order around the
+    optional (N, 3) pivots p. Pivot rotates are not supported."""
+    count = len(t)
+
+    parts = {}
+
+    parts["t"] = _translateMatrices(t)
+
+    rot = numpy.tile(numpy.eye(4), (count, 1, 1))
+    # rotmath matrices act on column vectors, hou's on row vectors
+    rot[:, :3, :3] = numpy.transpose(rotmath.eulerToMatrix(r, rotate_order), (0, 2, 1))
+    parts["r"] = rot
+
+    scale = numpy.tile(numpy.eye(4), (count, 1, 1))
+    scale[:, 0, 0] = s[:, 0]
+    scale[:, 1, 1] = s[:, 1]
+    scale[:, 2, 2] = s[:, 2]
+    parts["s"] = scale
+
+    out = parts[transform_order[0]]
+    for c in transform_order[1:]:
+        out = numpy.matmul(out, parts[c])
+
+    if p is not None:
+        out = numpy.matmul(numpy.matmul(_translateMatrices(-numpy.asarray(p)), out), _translateMatrices(p))
+
+    return out
+
+
+def composeWorld(local, pre, parents, depths, root_parents, lengths):
+    """Compose world transforms for a whole hierarchy.
+
+    local
+        (frames, bones, 4, 4) parm transforms
+    pre
+        (bones, 4, 4) pre-transforms
+    parents, depths
+        (bones,) parent index (-1 for roots) and depth of every bone
+    root_parents
+        (frames, bones, 4, 4) transforms inherited by roots, ignored for bones with a parent
+    lengths
+        (frames, bones) bone lengths, children are attached at the tip of their parent
+
+    Bones are composed a whole depth level at a time: world = local * pre * parent world * tip offset."""
+
+    frames, count = local.shape[:2]
+    world = numpy.empty((frames, count, 4, 4))
+
+    # the transform each bone passes on to its children
+    offsets = numpy.tile(numpy.eye(4), (frames, count, 1, 1))
+    offsets[:, :, 3, 2] = -lengths
+
+    lp = numpy.matmul(local, pre[None])
+
+    for depth in range(int(depths.max()) + 1 if count else 0):
+        level = numpy.nonzero(depths == depth)[0]
+        level_parents = parents[level]
+
+        inherited = root_parents[:, level].copy()
+        has_parent = level_parents >= 0
+
+        if has_parent.any():
+            p = level_parents[has_parent]
+            inherited[:, has_parent] = numpy.matmul(offsets[:, p], world[:, p])
+
+        world[:, level] = numpy.matmul(lp[:, level], inherited)
+
+    return world
+
+
+def inheritedTransforms(node, frames, input_node=None):
+    """(frames, 4, 4) transforms the given node inherits from its input, or from its containing subnet when it has
+    none. A bone input passes on its tip. input_node defaults to the node's first input."""
+    if input_node is None:
+        inputs = node.inputs()
+        input_node = inputs[0] if inputs else None
+
+    parent = input_node
+    is_bone = parent is not None and parent.type().name() == "bone"
+
+    if parent is None:
+        parent = node.parent()
+        if not isinstance(parent, hou.ObjNode):
+            return numpy.tile(numpy.eye(4), (len(frames), 1, 1))
+
+    out = numpy.empty((len(frames), 4, 4))
+
+    for f_idx, frame in enumerate(frames):
+        out[f_idx] = numpy.array(parent.worldTransformAtTime(hou.frameToTime(frame)).asTupleOfTuples())
+
+        if is_bone:
+            offset = numpy.eye(4)
+            offset[3, 2] = -parent.parm("length").evalAtFrame(frame)
+            out[f_idx] = numpy.dot(offset, out[f_idx])
+
+    return out
+
+
+def placementValues(node, world, frames):
+    """The t and r parm values that give node the world transforms (frames, 4, 4) at every frame, taking its
+    pre-transform, inherited transform and pivot into account. Assumes the default srt transform order and no scale."""
+    inherited = inheritedTransforms(node, frames)
+    pre = numpy.array(node.preTransform().asTupleOfTuples())
+
+    p = numpy.array([node.parmTuple("p").evalAtFrame(f) for f in frames])
+    _checkPivotRotates(node, [node.parmTuple("pr").evalAtFrame(f) for f in frames])
+
+    parm = numpy.matmul(world, numpy.linalg.inv(numpy.matmul(pre[None], inherited)))
+
+    # parm = T(-p) * R * T(p) * T(t), so its translation row is t + p - p * R
+    t = parm[:, 3, :3] + numpy.matmul(p[:, None], parm[:, :3, :3])[:, 0] - p
+    r = rotmath.matrixToEuler(numpy.transpose(parm[:, :3, :3], (0, 2, 1)), node.parm("rOrd").evalAsString())
+
+    return t, r
+
+
+class SkeletonPose(object):
+    """World transforms of every bone of a Skeleton over a set of frames, as returned by Skeleton.evaluate().
+
+    matrices is (frames, bones, 4, 4) using the row vector convention of hou.Matrix4, roots and tips are
+    (frames, bones, 3) and lengths is (frames, bones), all indexed in the skeleton's bone order."""
+
+    def __init__(self, skeleton, frames, matrices, lengths, pre=None, root_parents=None):
+        self.skeleton = skeleton
+        self.frames = frames
+        self.matrices = matrices
+        self.lengths = lengths
+        self.pre = pre
+        self.root_parents = root_parents
+
+        self.roots = matrices[:, :, 3, :3]
+        # the tip is (0, 0, -length) in bone space
+        self.tips = self.roots - lengths[:, :, None] * matrices[:, :, 2, :3]
+
+    def inherited(self, idx):
+        """(frames, 4, 4) transforms the bone at idx inherits, its parent's tip or the root parent transform"""
+        parent = self.skeleton.parents[idx]
+
+        if parent < 0:
+            return self.root_parents[:, idx]
+
+        offset = numpy.tile(numpy.eye(4), (len(self.frames), 1, 1))
+        offset[:, 3, 2] = -self.lengths[:, parent]
+
+        return numpy.matmul(offset, self.matrices[:, parent])
+
+    def _idx(self, bone):
+        if isinstance(bone, int):
+            return bone
+        return self.skeleton.index(bone)
+
+    def xform(self, bone, frame_idx=0):
+        return hou.Matrix4(self.matrices[frame_idx, self._idx(bone)].tolist())
+
+    def root(self, bone, frame_idx=0):
+        return hou.Vector3(self.roots[frame_idx, self._idx(bone)].tolist())
+
+    def tip(self, bone, frame_idx=0):
+        return hou.Vector3(self.tips[frame_idx, self._idx(bone)].tolist())
+
+
+class Joint(object):
+    """compact topology record for a single bone"""
+    __slots__ = ("index", "node", "name", "parent", "children", "input_node", "solver")
+
+    def __init__(self, index, node):
+        self.index = index
+        self.node = node
+        self.name = node.name()
+        self.parent = -1
+        self.children = ()
+        self.input_node = None
+        self.solver = None
+
+
+class Skeleton(object):
+    def __init__(self, source):
+        """
+        :param source: a subnet whose bones make up the skeleton, or a sequence of nodes
+        """
+        if isinstance(source, hou.Node):
+            self.container = source
+        else:
+            self.container = None
+            source = tuple(source)
+
+        self._source = source
+        self._callbacks = ()
+        self.valid = False
+
+        self.build()
+
+    def _source_nodes(self):
+        if self.container is not None:
+            return self.container.allSubChildren()
+
+        # drop nodes deleted since the skeleton was created
+        alive = ()
+        for n in self._source:
+            try:
+                n.sessionId()
+            except hou.ObjectWasDeleted:
+                continue
+            alive += (n,)
+
+        self._source = alive
+        return alive
+
+    def build(self):
+        self.release()
+
+        nodes = tuple(n for n in self._source_nodes() if n.type().name() == "bone")
+        nodes = bonemodule.hierarchy_sort(nodes)
+        parents = bonemodule.hierarchy_parents(nodes)
+
+        self.joints = tuple(Joint(idx, n) for idx, n in enumerate(nodes))
+        self._index = dict((n.sessionId(), idx) for idx, n in enumerate(nodes))
+
+        children = [[] for _ in nodes]
+
+        for idx, joint in enumerate(self.joints):
+            inputs = joint.node.inputs()
+            joint.input_node = inputs[0] if inputs else None
+
+            # hierarchy_parents walks through non-bones, but like Bone.parent only a direct input counts as a parent
+            parent = parents[idx]
+            if parent is not None and joint.input_node is not None and \
+                    joint.input_node.sessionId() == nodes[parent].sessionId():
+                joint.parent = parent
+                children[parent].append(idx)
+
+        for idx, joint in enumerate(self.joints):
+            # keep the order of outputs(), so the first child matches Bone.child
+            if len(children[idx]) > 1:
+                outputs = [o.sessionId() for o in joint.node.outputs()]
+                children[idx].sort(key=lambda c: outputs.index(nodes[c].sessionId()))
+
+            joint.children = tuple(children[idx])
+
+        self.parents = numpy.array([j.parent for j in self.joints], dtype=int)
+        self.children = tuple(j.children for j in self.joints)
+
+        # parents always come before their children, so depths fill in a single pass
+        self.depths = numpy.zeros(len(self.joints), dtype=int)
+        for idx, parent in enumerate(self.parents):
+            if parent >= 0:
+                self.depths[idx] = self.depths[parent] + 1
+
+        self._build_solvers()
+
+        self._bones = [None] * len(self.joints)
+        self._chains = {}
+        self.valid = True
+
+        self._watch()
+
+    def _build_solvers(self):
+        # the skeleton watches the solvers itself (see _watch), a change rebuilds the whole skeleton anyway
+        index = SolverIndex.fromBones((j.node for j in self.joints), watch=False)
+
+        # solver session id -> (solver node, bone indices in chain order)
+        self.solvers = {}
+
+        for sid, entry in index.solvers.items():
+            bones = [self._index[n.sessionId()] for n in entry.chain if n.sessionId() in self._index]
+            if not bones:
+                continue
+
+            self.solvers[sid] = (entry.solver, bones)
+            for idx in bones:
+                self.joints[idx].solver = entry.solver
+
+    def _on_event(self, **kwargs):
+        if _pathsChanged(kwargs):
+            self.valid = False
+
+    def _watch(self):
+        callbacks = ()
+
+        for joint in self.joints:
+            joint.node.addEventCallback(_BONE_EVENTS, self._on_event)
+            callbacks += ((joint.node, _BONE_EVENTS),)
+
+        if self.container is not None:
+            self.container.addEventCallback(_CONTAINER_EVENTS, self._on_event)
+            callbacks += ((self.container, _CONTAINER_EVENTS),)
+
+        for solver, _ in self.solvers.values():
+            solver.addEventCallback(_SOLVER_EVENTS, self._on_event)
+            callbacks += ((solver, _SOLVER_EVENTS),)
+
+        self._callbacks = callbacks
+
+    def release(self):
+        """remove the node event callbacks installed by this skeleton"""
+        for node, events in self._callbacks:
+            try:
+                node.removeEventCallback(events, self._on_event)
+            except hou.ObjectWasDeleted:
+                pass
+            except hou.OperationFailed:
+                pass
+
+        self._callbacks = ()
+
+    def invalidate(self):
+        self.valid = False
+
+    def _check(self):
+        if not self.valid:
+            self.build()
+
+    def __len__(self):
+        self._check()
+        return len(self.joints)
+
+    def index(self, node):
+        """index of the given node or Bone, or None if it isn't part of the skeleton"""
+        self._check()
+        return self._index.get(bonemodule._node_of(node).sessionId())
+
+    @property
+    def bones(self):
+        self._check()
+        return tuple(self.bone(idx) for idx in range(len(self.joints)))
+
+    def bone(self, idx):
+        """the cached Bone at the given index"""
+        self._check()
+
+        b = self._bones[idx]
+        if b is None:
+            b = bonemodule.Bone(self.joints[idx].node)
+            b.skeleton = self
+            self._bones[idx] = b
+
+        return b
+
+    def bone_of(self, node):
+        idx = self.index(node)
+        if idx is None:
+            return None
+        return self.bone(idx)
+
+    def parent_of(self, bone):
+        """the parent Bone, the raw input node for non-bone parents, or None, matching Bone.parent"""
+        idx = self.index(bone)
+        joint = self.joints[idx]
+
+        if joint.parent >= 0:
+            return self.bone(joint.parent)
+
+        if joint.input_node is not None:
+            if joint.input_node.type().name() == "bone":
+                # a bone outside of this skeleton
+                return bonemodule.Bone(joint.input_node)
+            return joint.input_node
+
+        return None
+
+    def child_of(self, bone):
+        """the first child Bone or None, matching Bone.child"""
+        idx = self.index(bone)
+        children = self.joints[idx].children
+
+        if children:
+            return self.bone(children[0])
+        return None
+
+    def children_of(self, bone):
+        idx = self.index(bone)
+        return tuple(self.bone(c) for c in self.joints[idx].children)
+
+    def solver_of(self, bone):
+        idx = self.index(bone)
+        return self.joints[idx].solver or False
+
+    def ik_chain(self, bone):
+        """the cached IK_Chain of the solver the given bone belongs to, or False"""
+        solver = self.solver_of(bone)
+
+        if not solver:
+            return False
+
+        sid = solver.sessionId()
+        chain = self._chains.get(sid)
+
+        if chain is None:
+            chain = bonemodule.IK_Chain(tuple(self.bone(idx) for idx in self.solvers[sid][1]))
+            self._chains[sid] = chain
+
+        return chain
+
+    def evaluate(self, frames=None):
+        """Compute the world transforms of every bone at the given frames (the current frame by default).
+
+        All translate, rotate, scale, pivot and length parms are evaluated in one bake, pre-transforms and
+        rotate/transform orders are read once per bone and the hierarchy is composed as numpy matrix stacks, see
+        composeWorld(). Raises hou.Error for bones with a pivot rotate. Returns a SkeletonPose."""
+        self._check()
+
+        if frames is None:
+            frames = (hou.frame(),)
+        frames = tuple(frames)
+
+        count = len(self.joints)
+        nodes = tuple(j.node for j in self.joints)
+
+        tuples = ()
+        for n in nodes:
+            tuples += (n.parmTuple("t"), n.parmTuple("r"), n.parmTuple("s"), n.parmTuple("scale"),
+                       n.parmTuple("length"), n.parmTuple("p"), n.parmTuple("pr"))
+
+        # short bakes (e.g. the current frame) run without a dialog
+        callback = (lambda fraction: True) if len(frames) <= _QUIET_FRAMES else None
+
+        bake = channelbake.bakeParmTuples(tuples, frames, callback=callback)
+        data = bake.data.reshape(len(frames), count, 17)
+
+        local = numpy.empty((len(frames), count, 4, 4))
+        pre = numpy.empty((count, 4, 4))
+        root_parents = numpy.tile(numpy.eye(4), (len(frames), count, 1, 1))
+
+        for idx, n in enumerate(nodes):
+            _checkPivotRotates(n, data[:, idx, 14:17])
+
+            scale = data[:, idx, 6:9] * data[:, idx, 9:10]
+            local[:, idx] = localMatrices(data[:, idx, 0:3], data[:, idx, 3:6], scale,
+                                          n.parm("rOrd").evalAsString(), n.parm("xOrd").evalAsString(),
+                                          data[:, idx, 11:14])
+            pre[idx] = numpy.array(n.preTransform().asTupleOfTuples())
+
+            if self.joints[idx].parent < 0:
+                root_parents[:, idx] = inheritedTransforms(n, frames, self.joints[idx].input_node)
+
+        matrices = composeWorld(local, pre, self.parents, self.depths, root_parents, data[:, :, 10])
+
+        return SkeletonPose(self, frames, matrices, data[:, :, 10], pre, root_parents)
+
+    def descendants(self, idx):
+        """indices of every bone below the given index, in hierarchy order"""
+        self._check()
+
+        out = []
+        stack = list(self.joints[idx].children[::-1])
+
+        while stack:
+            c = stack.pop()
+            out.append(c)
+            stack.extend(self.joints[c].children[::-1])
+
+        return tuple(out)
+
+    def fit(self, targets, compensate=True):
+        """Refit the skeleton to new tip positions, e.g. joints from a template or point cloud.
+
+        targets maps nodes (or Bones) to world positions for their tips. Bones are placed in hierarchy order: every
+        bone's root moves to its parent's new tip and the bone is aimed and stretched onto its target. With compensate
+        bones without a target keep their tips where they are, otherwise they follow their parent unchanged. Branching
+        children are handled like any other bone.
+
+        Like Bone.xform the changes go into the pre-transforms (and lengths), the parm values are left alone. Everything
+        is computed from a single evaluate() and written in one undo group. Returns the number of bones changed."""
+        self._check()
+
+        goals = {}
+        for key, pos in dict(targets).items():
+            idx = self.index(key)
+            if idx is None:
+                raise hou.Error(bonemodule._node_of(key).path() + " is not part of the skeleton")
+            goals[idx] = numpy.array(tuple(pos), dtype=float)
+
+        if not self.joints:
+            return 0
+
+        pose = self.evaluate()
+        world = pose.matrices[0]
+        lengths = pose.lengths[0]
+        roots = pose.roots[0]
+        tips = pose.tips[0]
+
+        count = len(self.joints)
+        new_world = world.copy()
+        new_lengths = lengths.copy()
+        old_inherited = numpy.stack([pose.inherited(idx)[0] for idx in range(count)])
+        inherited = numpy.empty((count, 4, 4))
+
+        def _tip_transform(m, length):
+            offset = numpy.eye(4)
+            offset[3, 2] = -length
+            return numpy.dot(offset, m)
+
+        # parents always come before their children
+        for idx in range(count):
+            parent = self.parents[idx]
+
+            if parent < 0:
+                inherited[idx] = pose.root_parents[0, idx]
+                root = roots[idx]
+            else:
+                inherited[idx] = _tip_transform(new_world[parent], new_lengths[parent])
+                root = new_world[parent, 3, :3] - new_lengths[parent] * new_world[parent, 2, :3]
+
+            if idx not in goals and not compensate:
+                # ride along with the parent
+                new_world[idx] = numpy.dot(numpy.dot(world[idx], numpy.linalg.inv(old_inherited[idx])), inherited[idx])
+                continue
+
+            tip = goals.get(idx, tips[idx])
+
+            # rotate along the shortest arc from the old direction onto the new one, see ikmath.alignMatrices()
+            align = ikmath.alignMatrices((tips[idx] - roots[idx])[None], (tip - root)[None])[0]
+            new_world[idx, :3, :3] = numpy.dot(world[idx, :3, :3], align.T)
+            new_world[idx, 3, :3] = root
+            new_lengths[idx] = numpy.linalg.norm(tip - root)
+
+        # world = parm * pre * inherited, keep the parm transform and solve for the pre-transform
+        parm = numpy.matmul(world, numpy.linalg.inv(numpy.matmul(pose.pre, old_inherited)))
+        pre = numpy.matmul(numpy.matmul(numpy.linalg.inv(parm), new_world), numpy.linalg.inv(inherited))
+
+        changed = 0
+
+        with hou.undos.group("Fit Skeleton"):
+            for idx, joint in enumerate(self.joints):
+                if numpy.allclose(pre[idx], pose.pre[idx]) and numpy.isclose(new_lengths[idx], lengths[idx]):
+                    continue
+
+                joint.node.setPreTransform(hou.Matrix4(pre[idx].tolist()))
+                joint.node.parm("length").set(float(new_lengths[idx]))
+                changed += 1
+
+        return changed
+
+
+def _pathNode(node, name):
+    """the node a path parm of node points at, or None"""
+    parm = node.parm(name)
+    if parm is None:
+        return None
+
+    path = parm.eval()
+    if not path:
+        return None
+
+    return node.node(path)
+
+
+class SolverEntry(object):
+    """an inversekin solver with its chain (root bone first) and goals"""
+    __slots__ = ("solver", "chain", "end_goal", "twist_goal", "_tracks")
+
+    def __init__(self, solver):
+        self.solver = solver
+        self.chain = self._chain(solver)
+        self.end_goal = _pathNode(solver, "endaffectorpath")
+        self.twist_goal = _pathNode(solver, "twistaffectorpath")
+        self._tracks = None
+
+    @property
+    def tracks(self):
+        """the solver's tracks by bone name, read on first use"""
+        if self._tracks is None:
+            self._tracks = {}
+            for track in self.solver.tracks():
+                bone_name = track.name().split("/")[-1].split(":")[0]
+                self._tracks[bone_name] = self._tracks.get(bone_name, ()) + (track,)
+
+        return self._tracks
+
+    @staticmethod
+    def _chain(solver):
+        root = _pathNode(solver, "bonerootpath")
+        end = _pathNode(solver, "boneendpath")
+
+        if root is not None and end is not None:
+            # walk up from the end bone, so the chain comes out in the order it is wired
+            chain = []
+            cur = end
+            while cur is not None:
+                if cur.type().name() == "bone":
+                    chain.append(cur)
+                if cur.sessionId() == root.sessionId():
+                    return tuple(chain[::-1])
+
+                inputs = cur.inputs()
+                cur = inputs[0] if inputs else None
+
+        # the end bone isn't below the root bone, fall back to whatever depends on the solver
+        return bonemodule.hierarchy_sort(n for n in solver.dependents() if n.type().name() == "bone")
+
+
+class SolverIndex(object):
+    """A bone -> IK solver lookup across a rig.
+
+    Every solver's chain is read from its root and end bone parms once, after which the solver, chain and goals of any
+    bone are a dictionary lookup away. Solvers whose path parms change (or which are deleted) are re-read on the next
+    query, call update() with nodes that changed elsewhere, e.g. after rewiring bones.
+
+    index = SolverIndex.fromSubnet(hou.node("/obj/rig"))
+    index.chain_of(hou.node("/obj/rig/bone2"))"""
+
+    def __init__(self, solvers=(), watch=True):
+        # solver session id -> SolverEntry
+        self.solvers = {}
+        # bone session id -> solver session id
+        self._bones = {}
+        self._stale = set()
+        self._watch = watch
+
+        for kin in solvers:
+            self._add(kin)
+
+    @classmethod
+    def fromSubnet(cls, subnet, watch=True):
+        """index every solver inside the given subnet"""
+        return cls((n for n in subnet.allSubChildren() if n.type().name() == "inversekin"), watch)
+
+    @classmethod
+    def fromBones(cls, nodes, watch=True):
+        """index the solvers of the given bones, bones already covered by a solver's chain aren't scanned again"""
+        index = cls(watch=watch)
+
+        for n in nodes:
+            if n.sessionId() in index._bones:
+                continue
+
+            for ref in n.references():
+                if ref.type().name() == "inversekin":
+                    index._add(ref)
+                    break
+
+        return index
+
+    def _add(self, kin):
+        sid = kin.sessionId()
+        if sid in self.solvers:
+            return
+
+        entry = SolverEntry(kin)
+        self.solvers[sid] = entry
+
+        for n in entry.chain:
+            self._bones[n.sessionId()] = sid
+
+        if self._watch:
+            kin.addEventCallback(_SOLVER_EVENTS, self._on_event)
+
+    def _remove(self, sid):
+        entry = self.solvers.pop(sid, None)
+        if entry is None:
+            return None
+
+        for n in entry.chain:
+            if self._bones.get(n.sessionId()) == sid:
+                del self._bones[n.sessionId()]
+
+        if self._watch:
+            try:
+                entry.solver.removeEventCallback(_SOLVER_EVENTS, self._on_event)
+            except hou.ObjectWasDeleted:
+                pass
+            except hou.OperationFailed:
+                pass
+
+        return entry.solver
+
+    def _on_event(self, **kwargs):
+        if not _pathsChanged(kwargs):
+            return
+
+        sid = kwargs["node"].sessionId()
+
+        if kwargs["event_type"] == hou.nodeEventType.BeingDeleted:
+            self._remove(sid)
+            self._stale.discard(sid)
+        else:
+            self._stale.add(sid)
+
+    def _refresh(self):
+        stale, self._stale = self._stale, set()
+
+        for sid in stale:
+            kin = self._remove(sid)
+            if kin is not None:
+                self._add(kin)
+
+    def update(self, nodes):
+        """re-read the solvers of the given nodes, solvers among them are (re)indexed and bones are re-read through
+        their current solver"""
+        self._refresh()
+
+        for n in nodes:
+            if n.type().name() == "inversekin":
+                kin = self._remove(n.sessionId()) or n
+            else:
+                sid = self._bones.get(n.sessionId())
+                kin = self._remove(sid) if sid is not None else None
+
+                if kin is None:
+                    kin = next((r for r in n.references() if r.type().name() == "inversekin"), None)
+
+            if kin is not None:
+                self._add(kin)
+
+    def release(self):
+        """remove the node event callbacks installed by this index"""
+        for sid in tuple(self.solvers):
+            self._remove(sid)
+
+    def solver_entry(self, kin):
+        """the SolverEntry of the given inversekin node, it is indexed first if needed"""
+        self._refresh()
+        self._add(kin)
+        return self.solvers[kin.sessionId()]
+
+    def entry_of(self, bone):
+        """the SolverEntry of the given node or Bone, or None"""
+        self._refresh()
+        sid = self._bones.get(bonemodule._node_of(bone).sessionId())
+        return self.solvers.get(sid) if sid is not None else None
+
+    def solver_of(self, bone):
+        entry = self.entry_of(bone)
+        return entry.solver if entry else False
+
+    def chain_of(self, bone):
+        """the nodes of the bone's IK chain, root first"""
+        entry = self.entry_of(bone)
+        return entry.chain if entry else ()
+
+    def end_goal_of(self, bone):
+        entry = self.entry_of(bone)
+        return entry.end_goal if entry else None
+
+    def twist_goal_of(self, bone):
+        entry = self.entry_of(bone)
+        return entry.twist_goal if entry else None
@@ -0,0 +1,189 @@
+import numpy
+
+import channelmodel
+import keyframeutils
+
+try:
+    import hou
+except ImportError:
+    # channelmodel tuples bake without a Houdini session, just without the interrupt dialog
+    hou = None
+
+# Evaluates sets of parm tuples over a frame range into a single frames x channels numpy array, and writes such arrays
+# back as keys. Any tool that works over a range (tweening, IK/FK matching, exporting poses...) can sample through here
+# rather than calling evalAtFrame() itself.
+#
+# Float parms that are plain keyframed channels (only the interpolation functions channelmodel knows, no references)
+# are read into a channelmodel.Channel and evaluated over whole frame arrays at once, as are channelmodel tuples.
+# Everything else, e.g. expressions and references, is evaluated frame by frame through evalAtFrame().
+#
+# bake = channelbake.bakeParmTuples(keyframeutils.transformTuples(), range(1001, 1101))
+# bake.tupleValues(some_node.parmTuple("r"))   -> frames x 3 array
+# bake.write()                                 -> keys every sampled frame back onto the tuples
+
+
+class ChannelBake(object):
+    """The result of bakeParmTuples(), holds the sampled frames, the tuples and their values.
+
+    data is a contiguous float array of shape (len(frames), channels), where the components of each tuple occupy
+    consecutive columns in the order the tuples were given. offsets maps a tuple's index to its first column."""
+
+    def __init__(self, tuples, frames, data=None):
+        self.tuples = tuple(tuples)
+        self.frames = numpy.asarray(frames, dtype=float)
+
+        self.offsets = ()
+        channels = 0
+        for tup in self.tuples:
+            self.offsets += (channels,)
+            channels += len(tup)
+
+        self.channels = channels
+        # tuple -> index, so lookups don't scan every tuple
+        self._indices = dict((tup, idx) for idx, tup in enumerate(self.tuples))
+
+        if data is None:
+            data = numpy.zeros((len(self.frames), channels), dtype=float)
+
+        self.data = numpy.ascontiguousarray(data, dtype=float)
+
+        if self.data.shape != (len(self.frames), channels):
+            raise ValueError("data does not match the shape of the baked tuples")
+
+    def _index(self, tup):
+        idx = self._indices.get(tup)
+        if idx is None:
+            raise ValueError(str(tup) + " is not part of this bake")
+        return idx
+
+    def columns(self, tup):
+        """the column slice holding the given tuple's components"""
+        idx = self._index(tup)
+        start = self.offsets[idx]
+        return slice(start, start + len(self.tuples[idx]))
+
+    def tupleValues(self, tup):
+        """frames x components view of the given tuple's values"""
+        return self.data[:, self.columns(tup)]
+
+    def write(self, onlykeyed=False):
+        """key every sampled frame back onto the tuples, see keyframeutils.keyParmTuples()"""
+        values = tuple(self.data[:, self.offsets[idx]:self.offsets[idx] + len(tup)]
+                       for idx, tup in enumerate(self.tuples))
+
+        return keyframeutils.keyParmTuples(self.tuples, self.frames, values, onlykeyed=onlykeyed)
+
+
+def _chunks(count, chunk_size):
+    start = 0
+    while start < count:
+        yield start, min(start + chunk_size, count)
+        start += chunk_size
+
+
+def bakeParmTuples(tuples, frames, chunk_size=100, callback=None):
+    """Evaluate the given parm tuples at every frame into a ChannelBake.
+
+    Frames are evaluated in chunks of chunk_size. After every chunk callback is called with the fraction of frames
+    done, returning False from it stops the bake by raising hou.OperationInterrupted (keyframeutils.Error without
+    hou). Without a callback the bake runs inside a hou.InterruptableOperation so it reports progress and can be
+    cancelled from the UI, outside of a Houdini session it simply runs to the end.
+
+    channelmodel.ChannelTuples can be baked like parm tuples, string parm tuples are skipped."""
+
+    tuples = tuple(t for t in tuples if not keyframeutils.isString(t))
+    bake = ChannelBake(tuples, tuple(frames))
+
+    if callback is None and hou is None:
+        _bake(bake, chunk_size, lambda fraction: None)
+    elif callback is None:
+        with hou.InterruptableOperation("Baking Channels", open_interrupt_dialog=True) as op:
+            _bake(bake, chunk_size, op.updateProgress)
+    else:
+        def _progress(fraction):
+            if callback(fraction) is False:
+                if hou is None:
+                    raise keyframeutils.Error("bake interrupted")
+                raise hou.OperationInterrupted()
+
+        _bake(bake, chunk_size, _progress)
+
+    return bake
+
+
+# the expressions of keys channelmodel evaluates itself
+_PLAIN_EXPRESSIONS = frozenset(f + "()" for f in channelmodel.FUNCTIONS)
+
+
+def _plainChannel(parm, frames):
+    """a channelmodel.Channel that evaluates like parm at frames, or None if parm has to be evaluated through hou"""
+    if isinstance(parm, channelmodel.Channel):
+        return parm
+
+    if parm.parmTemplate().dataType() != hou.parmData.Float or parm.getReferencedParm() != parm:
+        return None
+
+    keys = parm.keyframes()
+    if not keys:
+        return channelmodel.Channel(parm.name(), (frames[0],), (parm.evalAtFrame(frames[0]),))
+
+    for k in keys:
+        if not k.isExpressionSet() or k.expression() not in _PLAIN_EXPRESSIONS or \
+                k.expressionLanguage() != hou.exprLanguage.Hscript:
+            return None
+
+    channel = channelmodel.Channel.fromParm(parm)
+
+    # auto slopes and extrapolation are only approximated, so compare one frame of every segment (and either side of
+    # the keys) with hou, frames on keys match anyway
+    keyed = set(channel.frames.tolist())
+    checked = set()
+
+    for f, segment in zip(frames, numpy.searchsorted(channel.frames, frames, side="right")):
+        if f in keyed or segment in checked:
+            continue
+        checked.add(segment)
+
+        expected = parm.evalAtFrame(f)
+        if abs(channel.evalAtFrame(f) - expected) > 1e-5 * max(1.0, abs(expected)):
+            return None
+
+    return channel
+
+
+def _bake(bake, chunk_size, progress):
+    count = len(bake.frames)
+
+    # (column, channel) for tuples of plain channels, evaluated a chunk of frames at a time, the other tuples are
+    # evaluated frame by frame with a single call each
+    columns = ()
+    tuples = ()
+
+    for idx, tup in enumerate(bake.tuples):
+        offset = bake.offsets[idx]
+        channels = tuple(_plainChannel(p, bake.frames) for p in tup)
+
+        if all(c is not None for c in channels):
+            columns += tuple((offset + c_idx, c) for c_idx, c in enumerate(channels))
+        else:
+            tuples += ((offset, tup),)
+
+    for start, end in _chunks(count, chunk_size):
+        chunk = bake.frames[start:end]
+
+        for column, channel in columns:
+            bake.data[start:end, column] = channel.evaluate(chunk)
+
+        for f_idx in range(start, end):
+            frame = bake.frames[f_idx]
+            row = bake.data[f_idx]
+
+            for offset, tup in tuples:
+                row[offset:offset + len(tup)] = tup.evalAtFrame(frame)
+
+        progress(float(end) / count)
+
+
+def writeBake(tuples, frames, data, onlykeyed=False):
+    """key a frames x channels array onto the given tuples, laid out as in ChannelBake"""
+    return ChannelBake(tuples, frames, data).write(onlykeyed=onlykeyed)
@@ -0,0 +1,439 @@
+import numpy
+
+# An in-memory model of animation channels that doesn't need a Houdini session, so animation can be processed and
+# tested in batch jobs, on the farm or anywhere else hou isn't available.
+#
+# A Channel mirrors the keys of a single parm: frames, values, in/out slopes, auto slope flags, in/out accelerations
+# (slopes and accelerations in seconds, as in hou.Keyframe) and the interpolation function of every key, all stored in
+# numpy arrays. Channels evaluate the common interpolation functions vectorized over any number of frames. A
+# ChannelTuple groups channels the way a hou.ParmTuple groups parms.
+#
+# Channels also answer the hou.Parm methods the batch functions in keyframeutils, retime, channelbake and keyreduce
+# use (keyframes(), keyframesBefore(), setKeyframes(), evalAtFrame()...), with Keyframe objects standing in for
+# hou.Keyframe, and ChannelTuples those of hou.ParmTuple. Those functions therefore work on channels as they do on
+# live parms, there is no separate retime or tween implementation here. They import hou only when it is available, so
+# channels are processed anywhere, hou is required only by the converters from and to live parms.
+#
+# ch = ChannelTuple.fromParmTuple(hou.parmTuple("/obj/bone1/r"), "xyz")
+# values = ch.bake(numpy.arange(1001, 1101))
+# retime.scaleParmTuples((ch,), 0.5, pivot=1001)
+# keyframeutils.tweenParmTuples((ch,), ref_frame=1010)
+# ch.toParmTuple(hou.parmTuple("/obj/bone1/r"))
+#
+# Interpolation functions, applied to the segment following a key, as with hou.Keyframe:
+#
+# constant  holds the key's value
+# linear    straight line to the next key
+# bezier    bezier through the out slope/accel of the key and the in slope/accel of the next one, accelerations are
+#           the length of the handles in seconds
+# cubic     hermite curve through the out slope of the key and the in slope of the next one
+# ease      smoothstep between the two values, easein / easeout ease at one end only
+#
+# Unknown functions evaluate as bezier. Frames before the first key and after the last hold the end values. Auto slopes
+# are the slope between the two neighbouring keys (or towards the only neighbour at either end).
+
+FUNCTIONS = ("constant", "linear", "bezier", "cubic", "ease", "easein", "easeout")
+
+
+class Keyframe(object):
+    """A key of a Channel, mirroring the hou.Keyframe methods used by keyframeutils, retime and channelbake.
+    Slopes are per second and accelerations in seconds, unset slopes and accelerations read as 0."""
+
+    def __init__(self, frame=0.0, value=0.0):
+        self._frame = float(frame)
+        self._value = float(value)
+        self._expression = None
+        self._language = None
+        self._slope = None
+        self._in_slope = None
+        self._slope_auto = False
+        self._in_slope_auto = False
+        self._accel = None
+        self._in_accel = None
+
+    def frame(self):
+        return self._frame
+
+    def setFrame(self, frame):
+        self._frame = float(frame)
+
+    def value(self):
+        return self._value
+
+    def setValue(self, value):
+        self._value = float(value)
+
+    def expression(self):
+        return self._expression or ""
+
+    def isExpressionSet(self):
+        return self._expression is not None
+
+    def setExpression(self, expression, language=None):
+        self._expression = expression
+        self._language = language
+
+    def expressionLanguage(self):
+        """the language given to setExpression(), channels only keep the function name"""
+        return self._language
+
+    def isSlopeUsed(self):
+        return self._slope is not None or self._in_slope is not None
+
+    def slope(self):
+        return self._slope or 0.0
+
+    def setSlope(self, slope):
+        self._slope = float(slope)
+        self._slope_auto = False
+
+    def inSlope(self):
+        return self.slope() if self._in_slope is None else self._in_slope
+
+    def setInSlope(self, slope):
+        self._in_slope = float(slope)
+        self._in_slope_auto = False
+
+    def isSlopeAuto(self):
+        return self._slope_auto
+
+    def setSlopeAuto(self, on):
+        self._slope_auto = bool(on)
+
+    def isInSlopeAuto(self):
+        return self._in_slope_auto
+
+    def setInSlopeAuto(self, on):
+        self._in_slope_auto = bool(on)
+
+    def isAccelUsed(self):
+        return self._accel is not None or self._in_accel is not None
+
+    def accel(self):
+        return self._accel or 0.0
+
+    def setAccel(self, accel):
+        self._accel = float(accel)
+
+    def inAccel(self):
+        return self.accel() if self._in_accel is None else self._in_accel
+
+    def setInAccel(self, accel):
+        self._in_accel = float(accel)
+
+
+def _readKey(key):
+    """the row of a Channel holding the given Keyframe or hou.Keyframe, in Channel._fields() order plus the function"""
+    function = "bezier"
+    if key.isExpressionSet():
+        function = key.expression().split("(")[0].strip() or "bezier"
+
+    slope_auto = key.isSlopeAuto()
+    in_slope_auto = key.isInSlopeAuto()
+    slope_used = key.isSlopeUsed()
+    accel_used = key.isAccelUsed()
+
+    return (float(key.frame()),
+            float(key.value()),
+            key.slope() if slope_used and not slope_auto else 0.0,
+            key.inSlope() if slope_used and not in_slope_auto else 0.0,
+            key.accel() if accel_used else 0.0,
+            key.inAccel() if accel_used else 0.0,
+            slope_auto,
+            in_slope_auto,
+            function)
+
+
+class Channel(object):
+    """The keys of a single channel, stored as parallel arrays sorted by frame. Slopes are per second and
+    accelerations in seconds like those of hou.Keyframe, fps converts them to the frames segments are evaluated in."""
+
+    def __init__(self, name="", frames=(), values=(), slopes=None, in_slopes=None, accels=None, in_accels=None,
+                 functions=None, slope_auto=None, in_slope_auto=None, fps=24.0):
+        self._name = name
+        self.fps = float(fps)
+
+        self.frames = numpy.asarray(frames, dtype=float)
+        count = len(self.frames)
+
+        self.values = numpy.asarray(values, dtype=float)
+        self.slopes = numpy.zeros(count) if slopes is None else numpy.asarray(slopes, dtype=float)
+        self.in_slopes = self.slopes.copy() if in_slopes is None else numpy.asarray(in_slopes, dtype=float)
+        self.accels = numpy.zeros(count) if accels is None else numpy.asarray(accels, dtype=float)
+        self.in_accels = self.accels.copy() if in_accels is None else numpy.asarray(in_accels, dtype=float)
+        self.slope_auto = numpy.zeros(count, dtype=bool) if slope_auto is None else \
+            numpy.asarray(slope_auto, dtype=bool)
+        self.in_slope_auto = self.slope_auto.copy() if in_slope_auto is None else \
+            numpy.asarray(in_slope_auto, dtype=bool)
+        self.functions = ["bezier"] * count if functions is None else list(functions)
+
+        self._sort()
+
+    def __len__(self):
+        return len(self.frames)
+
+    def _fields(self):
+        return ("frames", "values", "slopes", "in_slopes", "accels", "in_accels", "slope_auto", "in_slope_auto")
+
+    def _sort(self):
+        self._take(numpy.argsort(self.frames, kind="mergesort"))
+
+    def _take(self, indices):
+        for f in self._fields():
+            setattr(self, f, getattr(self, f)[indices])
+        self.functions = [self.functions[i] for i in indices]
+
+    def _fillKey(self, idx, key, language=None):
+        """write key idx into a Keyframe or hou.Keyframe"""
+        key.setFrame(float(self.frames[idx]))
+        key.setValue(float(self.values[idx]))
+        key.setExpression(self.functions[idx] + "()", language)
+
+        if self.slope_auto[idx]:
+            key.setSlopeAuto(True)
+        else:
+            key.setSlope(float(self.slopes[idx]))
+
+        if self.in_slope_auto[idx]:
+            key.setInSlopeAuto(True)
+        else:
+            key.setInSlope(float(self.in_slopes[idx]))
+
+        if self.accels[idx] > 0.0:
+            key.setAccel(float(self.accels[idx]))
+        if self.in_accels[idx] > 0.0:
+            key.setInAccel(float(self.in_accels[idx]))
+
+        return key
+
+    def _key(self, idx):
+        return self._fillKey(idx, Keyframe())
+
+    def setKey(self, frame, value, slope=0.0, in_slope=None, accel=0.0, in_accel=None, function="bezier"):
+        """add a key, replacing any key already on that frame"""
+        key = Keyframe(frame, value)
+        key.setExpression(function + "()")
+        key.setSlope(slope)
+        key.setInSlope(slope if in_slope is None else in_slope)
+        key.setAccel(accel)
+        key.setInAccel(accel if in_accel is None else in_accel)
+
+        self.setKeyframe(key)
+
+    def deleteKeys(self, start, end):
+        """remove all keys in the frame range"""
+        self._take(numpy.nonzero((self.frames < start) | (self.frames > end))[0])
+
+    def keyIndicesInRange(self, start, end):
+        return numpy.arange(numpy.searchsorted(self.frames, start, side="left"),
+                            numpy.searchsorted(self.frames, end, side="right"))
+
+    def _autoSlopes(self):
+        """per second slopes between the neighbours of every key, at least two keys are needed"""
+        idx = numpy.arange(len(self.frames))
+        prev = numpy.maximum(idx - 1, 0)
+        after = numpy.minimum(idx + 1, len(idx) - 1)
+
+        return (self.values[after] - self.values[prev]) / (self.frames[after] - self.frames[prev]) * self.fps
+
+    def evaluate(self, frames):
+        """evaluate the channel at an array of frames"""
+        t = numpy.atleast_1d(numpy.asarray(frames, dtype=float))
+        count = len(self.frames)
+
+        if count == 0:
+            return numpy.zeros(len(t))
+        if count == 1:
+            return numpy.full(len(t), self.values[0])
+
+        auto = self._autoSlopes()
+        slopes = numpy.where(self.slope_auto, auto, self.slopes)
+        in_slopes = numpy.where(self.in_slope_auto, auto, self.in_slopes)
+
+        seg = numpy.clip(numpy.searchsorted(self.frames, t, side="right") - 1, 0, count - 2)
+
+        t0 = self.frames[seg]
+        t1 = self.frames[seg + 1]
+        v0 = self.values[seg]
+        v1 = self.values[seg + 1]
+        h = t1 - t0
+        u = numpy.clip((t - t0) / h, 0.0, 1.0)
+
+        out = numpy.empty(len(t))
+        functions = numpy.array(self.functions)[seg]
+
+        for name in numpy.unique(functions):
+            sel = functions == name
+            out[sel] = self._segment(name, sel, seg, u, h, v0, v1, slopes, in_slopes)
+
+        out = numpy.where(t <= self.frames[0], self.values[0], out)
+        out = numpy.where(t >= self.frames[-1], self.values[-1], out)
+
+        return out
+
+    def _segment(self, name, sel, seg, u, h, v0, v1, slopes, in_slopes):
+        u = u[sel]
+        v0 = v0[sel]
+        v1 = v1[sel]
+        h = h[sel]
+
+        if name == "constant":
+            return v0
+        if name == "linear":
+            return v0 + (v1 - v0) * u
+        if name == "ease":
+            return v0 + (v1 - v0) * (u * u * (3.0 - 2.0 * u))
+        if name == "easein":
+            return v0 + (v1 - v0) * (u * u)
+        if name == "easeout":
+            return v0 + (v1 - v0) * (1.0 - (1.0 - u) ** 2)
+
+        # slopes are per second, segments are measured in frames
+        m0 = slopes[seg[sel]] / self.fps
+        m1 = in_slopes[seg[sel] + 1] / self.fps
+
+        if name == "cubic":
+            u2 = u * u
+            u3 = u2 * u
+            return ((2 * u3 - 3 * u2 + 1) * v0 + (u3 - 2 * u2 + u) * h * m0 +
+                    (-2 * u3 + 3 * u2) * v1 + (u3 - u2) * h * m1)
+
+        # bezier, accelerations are handle lengths in seconds, unset ones fall back to a third of the segment
+        a0 = self.accels[seg[sel]] * self.fps
+        a1 = self.in_accels[seg[sel] + 1] * self.fps
+        a0 = numpy.clip(numpy.where(a0 > 0.0, a0, h / 3.0), 0.0, h)
+        a1 = numpy.clip(numpy.where(a1 > 0.0, a1, h / 3.0), 0.0, h)
+
+        p1 = a0 / h
+        p2 = 1.0 - a1 / h
+        x = u
+
+        # solve the time curve for its parameter by bisection, it's monotonic for handles within the segment
+        lo = numpy.zeros(len(x))
+        hi = numpy.ones(len(x))
+        for _ in range(30):
+            s = (lo + hi) * 0.5
+            bt = 3 * (1 - s) ** 2 * s * p1 + 3 * (1 - s) * s * s * p2 + s ** 3
+            below = bt < x
+            lo = numpy.where(below, s, lo)
+            hi = numpy.where(below, hi, s)
+        s = (lo + hi) * 0.5
+
+        c1 = v0 + m0 * a0
+        c2 = v1 - m1 * a1
+
+        return (1 - s) ** 3 * v0 + 3 * (1 - s) ** 2 * s * c1 + 3 * (1 - s) * s * s * c2 + s ** 3 * v1
+
+    def evalAtFrame(self, frame):
+        return float(self.evaluate((frame,))[0])
+
+    # hou.Parm stand-ins, see the notes at the top of this file
+
+    def name(self):
+        return self._name
+
+    def path(self):
+        return self._name
+
+    def isLocked(self):
+        return False
+
+    def isHidden(self):
+        return False
+
+    def keyframes(self):
+        return tuple(self._key(i) for i in range(len(self.frames)))
+
+    def keyframesBefore(self, frame):
+        """keys at or before the given frame"""
+        return tuple(self._key(i) for i in range(numpy.searchsorted(self.frames, frame, side="right")))
+
+    def keyframesAfter(self, frame):
+        """keys at or after the given frame"""
+        start = numpy.searchsorted(self.frames, frame, side="left")
+        return tuple(self._key(i) for i in range(start, len(self.frames)))
+
+    def keyframesInRange(self, start_frame, end_frame):
+        return tuple(self._key(i) for i in self.keyIndicesInRange(start_frame, end_frame))
+
+    def setKeyframe(self, key):
+        self.setKeyframes((key,))
+
+    def setKeyframes(self, keys):
+        """add Keyframes or hou.Keyframes, replacing any keys already on their frames"""
+        # frame -> row, a later key on the same frame wins
+        rows = dict((row[0], row) for row in (_readKey(k) for k in keys))
+        if not rows:
+            return
+
+        self._take([idx for idx, f in enumerate(self.frames) if f not in rows])
+
+        rows = [rows[f] for f in sorted(rows)]
+        for idx, f in enumerate(self._fields()):
+            column = getattr(self, f)
+            setattr(self, f, numpy.append(column, [row[idx] for row in rows]).astype(column.dtype))
+        self.functions.extend(row[-1] for row in rows)
+
+        self._sort()
+
+    def deleteKeyframeAtFrame(self, frame):
+        self._take(numpy.nonzero(self.frames != frame)[0])
+
+    def deleteAllKeyframes(self):
+        self._take(numpy.arange(0))
+
+    @classmethod
+    def fromParm(cls, parm):
+        """read the keys of a live hou.Parm"""
+        import hou
+
+        channel = cls(name=parm.name(), fps=hou.fps())
+        channel.setKeyframes(parm.keyframes())
+
+        return channel
+
+    def toParm(self, parm):
+        """replace the keys of a live hou.Parm with this channel's keys"""
+        import hou
+
+        keys = tuple(self._fillKey(idx, hou.Keyframe(), hou.exprLanguage.Hscript) for idx in range(len(self.frames)))
+
+        parm.deleteAllKeyframes()
+        parm.setKeyframes(keys)
+
+
+class ChannelTuple(object):
+    """A group of channels standing in for a hou.ParmTuple. Tuples of euler rotates take their rotate_order, so
+    keyframeutils slerps them like the rotates of a node, see keyframeutils.isCompleteRotate()."""
+
+    def __init__(self, channels, name="", rotate_order=None):
+        self.channels = tuple(channels)
+        self._name = name
+        self.rotate_order = rotate_order
+
+    def __len__(self):
+        return len(self.channels)
+
+    def __iter__(self):
+        return iter(self.channels)
+
+    def __getitem__(self, idx):
+        return self.channels[idx]
+
+    def name(self):
+        return self._name
+
+    def evalAtFrame(self, frame):
+        return tuple(c.evalAtFrame(frame) for c in self.channels)
+
+    def bake(self, frames):
+        """(frames, components) array of the channels evaluated at every frame"""
+        return numpy.stack([c.evaluate(frames) for c in self.channels], axis=-1)
+
+    @classmethod
+    def fromParmTuple(cls, tup, rotate_order=None):
+        return cls((Channel.fromParm(p) for p in tup), name=tup.name(), rotate_order=rotate_order)
+
+    def toParmTuple(self, tup):
+        for idx, p in enumerate(tup):
+            self.channels[idx].toParm(p)
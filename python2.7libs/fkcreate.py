@@ -3,6 +3,16 @@ from PySide2 import QtWidgets, QtCore, QtGui
 import Bone
 from hdatools import fkcontrol, hdaparmutils
 
+# milliseconds FKInterface waits for the selection to settle before updating
+SELECTION_DEBOUNCE = 100
+
+# minimum milliseconds between PropertyBroadcast writes, about once per frame
+BROADCAST_INTERVAL = 16
+
+PARENT_EVENTS = (hou.nodeEventType.ParmTemplateChanged,
+                 hou.nodeEventType.SpareParmTemplatesChanged,
+                 hou.nodeEventType.BeingDeleted)
+
 
 def treeModelFromDict(d, model=None, cur_row=None):
     if not model:
@@ -228,14 +238,92 @@ class CtrlColor(QtWidgets.QWidget):
         self.pickbutton.setStyleSheet("background: rgb" + str(self.color.toTuple()))
 
 
+class PropertyBroadcast(QtCore.QObject):
+    """Coalesces property writes to many controls (e.g. FKControl.geoscale while dragging a slider).
+
+    set() only records the latest value per control and property, pending values are written at most once every
+    interval milliseconds with undos disabled, intermediate values are dropped. commit() then works like
+    CacheSlider.mouseReleaseEvent(): the written properties are put back to where they started with undos disabled
+    and the final values are written once within a single undo group."""
+
+    def __init__(self, interval=BROADCAST_INTERVAL, parent=None):
+        super(PropertyBroadcast, self).__init__(parent)
+
+        # (id(target), name) -> (target, name, value)
+        self._start = {}
+        self._latest = {}
+        self._pending = set()
+        self._written = set()
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(interval)
+        self.timer.timeout.connect(self.flush)
+
+    @staticmethod
+    def _write(entries):
+        for target, name, value in entries:
+            try:
+                setattr(target, name, value)
+            except hou.ObjectWasDeleted:
+                pass
+
+    def set(self, targets, name, value):
+        """queue value for the property name of every target"""
+        for target in targets:
+            key = (id(target), name)
+            self._latest[key] = (target, name, value)
+            self._pending.add(key)
+
+        if self._pending and not self.timer.isActive():
+            self.timer.start()
+
+    def flush(self):
+        """write the pending values now, without adding to the undo history"""
+        self.timer.stop()
+
+        pending, self._pending = self._pending, set()
+
+        # only values written here need putting back on commit(), so that's the only time they're read
+        for key in pending:
+            if key not in self._start:
+                target, name, _ = self._latest[key]
+                try:
+                    self._start[key] = (target, name, getattr(target, name))
+                except hou.ObjectWasDeleted:
+                    pass
+
+        with hou.undos.disabler():
+            self._write(self._latest[key] for key in pending)
+
+        self._written.update(pending)
+
+    def commit(self, undogroup):
+        """write the latest values as a single undo entry"""
+        self.timer.stop()
+
+        with hou.undos.disabler():
+            self._write(self._start[key] for key in self._written if key in self._start)
+
+        with hou.undos.group(undogroup):
+            self._write(self._latest.values())
+
+        self._start = {}
+        self._latest = {}
+        self._pending = set()
+        self._written = set()
+
+
 class CacheSlider(QtWidgets.QSlider):
-    def __init__(self, callback=None, undogroup="Slider Value Changed"):
+    def __init__(self, callback=None, undogroup="Slider Value Changed", on_release=None):
         super(CacheSlider, self).__init__()
         self.setTracking(True)
         self.startvalue = None
         self.endvalue = None
         self.callback = callback
         self.undogroup = undogroup
+        # called on release instead of replaying the callback, e.g. to commit a PropertyBroadcast
+        self.on_release = on_release
 
     def mousePressEvent(self, event):
         self.startvalue = self.value()
@@ -251,6 +339,11 @@ class CacheSlider(QtWidgets.QSlider):
             self.callback()
 
     def mouseReleaseEvent(self, event):
+        if self.on_release:
+            self.on_release()
+            self.startvalue = None
+            return
+
         self.endvalue = self.value()
         with hou.undos.disabler():
             self.setValue(self.startvalue)
@@ -263,7 +356,7 @@ class CacheSlider(QtWidgets.QSlider):
 
 
 class CtrlScale(QtWidgets.QWidget):
-    def __init__(self, callback=None):
+    def __init__(self, callback=None, on_release=None):
         super(CtrlScale, self).__init__()
 
         self.callback = callback
@@ -271,7 +364,7 @@ class CtrlScale(QtWidgets.QWidget):
         layout = QtWidgets.QHBoxLayout()
         label = QtWidgets.QLabel("Control Scale")
 
-        self.slider = CacheSlider(callback=callback, undogroup="Change Control Scale")
+        self.slider = CacheSlider(callback=callback, undogroup="Change Control Scale", on_release=on_release)
         self.slider.setOrientation(QtCore.Qt.Horizontal)
         self.slider.setRange(0, 100)
         self.slider.setValue(10)
@@ -317,7 +410,18 @@ class FKInterface(QtWidgets.QDialog):
 
         self._getParent()
 
-        hou.ui.addEventLoopCallback(self._updateSelection)
+        # parent node session id -> cached folder model, dropped when the node's parm templates change
+        self._foldermodels = {}
+        self._watched = {}
+        self._refresh = False
+
+        # selection changes come in bursts, only act once they settle
+        self.selection_timer = QtCore.QTimer(self)
+        self.selection_timer.setSingleShot(True)
+        self.selection_timer.setInterval(SELECTION_DEBOUNCE)
+        self.selection_timer.timeout.connect(self._updateSelection)
+
+        hou.ui.addSelectionCallback(self._onSelectionChanged)
 
         layout = QtWidgets.QVBoxLayout()
         self.folder = None
@@ -334,7 +438,8 @@ class FKInterface(QtWidgets.QDialog):
         self.mask = TransformMask()
         self.orientation = CtrlOrientation(callback=self._onorient)
         self.ctrlcolor = CtrlColor(callback=self._oncolor)
-        self.ctrlscale = CtrlScale(callback=self._onscale)
+        self.broadcast = PropertyBroadcast(parent=self)
+        self.ctrlscale = CtrlScale(callback=self._onscale, on_release=self._onscalerelease)
 
         self.apply = QtWidgets.QPushButton("Create")
         self.clear_ctrls = QtWidgets.QPushButton("Clear Ctrls")
@@ -358,11 +463,41 @@ class FKInterface(QtWidgets.QDialog):
 
         self.setLayout(layout)
 
+    def _onSelectionChanged(self, selection):
+        self.selection_timer.start()
+
+    def _onParentEvent(self, **kwargs):
+        sid = kwargs["node"].sessionId()
+        self._foldermodels.pop(sid, None)
+
+        if kwargs["event_type"] == hou.nodeEventType.BeingDeleted:
+            self._watched.pop(sid, None)
+            return
+
+        if self.parent and self.parent.sessionId() == sid:
+            self._refresh = True
+            self.selection_timer.start()
+
+    def _folderModel(self, parent):
+        sid = parent.sessionId()
+        model = self._foldermodels.get(sid)
+
+        if model is None:
+            model = treeModelFromDict(hdaparmutils.folderHierarchy(parent.parmTemplateGroup()))
+            self._foldermodels[sid] = model
+
+            if sid not in self._watched:
+                parent.addEventCallback(PARENT_EVENTS, self._onParentEvent)
+                self._watched[sid] = parent
+
+        return model
+
     def _updateSelection(self):
         sel = hou.selectedNodes()
         try:
-            if sel != self.selected_nodes:
+            if sel != self.selected_nodes or self._refresh:
                 self.selected_nodes = sel
+                self._refresh = False
                 if len(self.selected_nodes) > 0:
                     self._getParent()
 
@@ -372,7 +507,7 @@ class FKInterface(QtWidgets.QDialog):
                         out_text += "None"
                     else:
                         out_text += self.parent.path()
-                        self.foldermodel = treeModelFromDict(hdaparmutils.folderHierarchy(self.parent.parmTemplateGroup()))
+                        self.foldermodel = self._folderModel(self.parent)
 
                     self.riglabel.setText(out_text)
 
@@ -418,24 +553,23 @@ class FKInterface(QtWidgets.QDialog):
         print(self.orientation.strip.getNames())
 
     def _onctrltype(self):
-        with hou.undos.group("Set Ctrl Type"):
-            for n in self.ctrls:
-                n.controltype = self.control_type.select.currentIndex()
+        self.broadcast.set(self.ctrls, "controltype", self.control_type.select.currentIndex())
+        self.broadcast.commit("Set Ctrl Type")
 
     def _onorient(self):
-        with hou.undos.group("Set Ctrl Orientation"):
-            for n in self.ctrls:
-                n.orientation = self.orientation.strip.getNames()
+        self.broadcast.set(self.ctrls, "orientation", self.orientation.strip.getNames())
+        self.broadcast.commit("Set Ctrl Orientation")
 
     def _oncolor(self):
-        with hou.undos.group("Set Ctrl Color"):
-            for ctrl in self.ctrls:
-                # trim off alpha channel from QColor
-                ctrl.dcolor = self.ctrlcolor.color.getRgbF()[0:3]
+        # trim off alpha channel from QColor
+        self.broadcast.set(self.ctrls, "dcolor", self.ctrlcolor.color.getRgbF()[0:3])
+        self.broadcast.commit("Set Ctrl Color")
 
     def _onscale(self):
-        for n in self.ctrls:
-            n.geoscale = self.ctrlscale.getValue()
+        self.broadcast.set(self.ctrls, "geoscale", self.ctrlscale.getValue())
+
+    def _onscalerelease(self):
+        self.broadcast.commit("Change Control Scale")
 
     def _clearctrls(self):
         self.ctrls = ()
@@ -445,24 +579,37 @@ class FKInterface(QtWidgets.QDialog):
 
     def _onapply(self):
         with hou.undos.group("Create FK Controls"):
-            for n in hou.selectedNodes():
-                if self.folderpath.text() == "":
-                    folderpathtuple = ()
-                else:
-                    folderpathtuple = tuple(self.folderpath.text().split("/"))
-                ctrl = fkcontrol.FKControl(n,
-                                           self.mask.strip.getValues(),
-                                           folder=folderpathtuple)
+            if self.folderpath.text() == "":
+                folderpathtuple = ()
+            else:
+                folderpathtuple = tuple(self.folderpath.text().split("/"))
+
+            ctrls = fkcontrol.buildFKControls(hou.selectedNodes(),
+                                              self.mask.strip.getValues(),
+                                              folder=folderpathtuple)
+
+            for ctrl in ctrls:
                 self.ctrls += (ctrl,)
                 ctrl.controltype = self.control_type.select.currentIndex()
                 ctrl.orientation = self.orientation.strip.getNames()
                 # trim off alpha channel from QColor
                 ctrl.dcolor = self.ctrlcolor.color.getRgbF()[0:3]
                 ctrl.geoscale = self.ctrlscale.getValue()
+
+            if ctrls:
                 self.apply.setVisible(False)
                 self.mask.setDisabled(True)
                 self.clear_ctrls.setVisible(True)
 
     def closeEvent(self, result):
-        print("closed!")
-        hou.ui.removeEventLoopCallback(self._updateSelection)
\ No newline at end of file
+        self.selection_timer.stop()
+        hou.ui.removeSelectionCallback(self._onSelectionChanged)
+
+        for node in self._watched.values():
+            try:
+                node.removeEventCallback(PARENT_EVENTS, self._onParentEvent)
+            except hou.ObjectWasDeleted:
+                pass
+
+        self._watched = {}
+        self._foldermodels = {}
\ No newline at end of file
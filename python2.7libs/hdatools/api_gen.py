@@ -21,21 +21,97 @@
 # SOFTWARE.
 
 
-def generate_properties(class_name, parms_list, tuples_list, file_path=None):
+import hashlib
+import keyword
+import os
+import re
+
+import hou
+
+# names the generated classes already use
+_RESERVED = ("node", "refresh", "get_many", "set_many", "to_dict", "from_dict", "PARMS", "TUPLES", "MENUS", "FOLDERS")
+
+# type name -> (modification time, class) of the wrappers generated or loaded this session
+_wrappers = {}
+
+
+def _dict_repr(d):
+    """repr of a dict with sorted keys, so generated code is stable"""
+    return "{" + ", ".join(repr(k) + ": " + repr(d[k]) for k in sorted(d)) + "}"
+
+
+def generate_properties(class_name, parms_list, tuples_list, file_path=None, menus=None, folders=None):
+    """Generate a wrapper class with a property for every parm in parms_list and parm tuple in tuples_list.
+
+    The hou.Parm / hou.ParmTuple handles are looked up once per instance and cached, get_many() / set_many() and
+    to_dict() / from_dict() read or write several properties in one go. menus (property -> menu items) and folders
+    (property -> containing folder labels) are stored on the class as MENUS and FOLDERS when given."""
+
+    extras = ""
+    if menus is not None or folders is not None:
+        extras = """    MENUS = {0}
+    FOLDERS = {1}
+""".format(_dict_repr(menus or {}), _dict_repr(folders or {}))
+
     out_str = """class {0}(object):
+    __slots__ = ("node", "_parms", "_tuples")
+
+    PARMS = {1}
+    TUPLES = {2}
+{3}
     def __init__(self, node):
         self.node = node
-""".format(class_name)
+        self._parms = {{}}
+        self._tuples = {{}}
+
+    def _parm(self, name):
+        parm = self._parms.get(name)
+        if parm is None:
+            parm = self.node.parm(name)
+            self._parms[name] = parm
+        return parm
+
+    def _parmTuple(self, name):
+        tup = self._tuples.get(name)
+        if tup is None:
+            tup = self.node.parmTuple(name)
+            self._tuples[name] = tup
+        return tup
+
+    def refresh(self):
+        \"\"\"drop the cached parm handles, e.g. after the node's parm templates changed\"\"\"
+        self._parms.clear()
+        self._tuples.clear()
+
+    def get_many(self, names=None):
+        \"\"\"the values of the given properties, all of them by default\"\"\"
+        if names is None:
+            names = self.PARMS + self.TUPLES
+        return tuple(getattr(self, n) for n in names)
+
+    def set_many(self, names, values):
+        for n, v in zip(names, values):
+            setattr(self, n, v)
+
+    def to_dict(self):
+        return dict(zip(self.PARMS + self.TUPLES, self.get_many()))
+
+    def from_dict(self, values):
+        for n, v in values.items():
+            if n not in self.PARMS and n not in self.TUPLES:
+                raise AttributeError("{0} has no property " + n)
+            setattr(self, n, v)
+""".format(class_name, repr(tuple(parms_list)), repr(tuple(tuples_list)), extras)
 
     for p in parms_list:
         template = """
     @property
     def {0}(self):
-        return self.node.evalParm("{0}")
-    
+        return self._parm("{0}").eval()
+
     @{0}.setter
     def {0}(self, value):
-        self.node.parm("{0}").set(value)  
+        self._parm("{0}").set(value)
 """
         out_str += template.format(p)
 
@@ -43,11 +119,11 @@ def generate_properties(class_name, parms_list, tuples_list, file_path=None):
         template = """
     @property
     def {0}(self):
-        return self.node.evalParmTuple("{0}")
+        return self._parmTuple("{0}").eval()
 
     @{0}.setter
     def {0}(self, value):
-        self.node.parmTuple("{0}").set(value)  
+        self._parmTuple("{0}").set(value)
 """
         out_str += template.format(t)
 
@@ -56,4 +132,163 @@ def generate_properties(class_name, parms_list, tuples_list, file_path=None):
         f.write(out_str)
         f.close()
     else:
-        return out_str
\ No newline at end of file
+        return out_str
+
+
+def _valid_name(name):
+    return re.match(r"^[A-Za-z_][A-Za-z0-9_]*$", name) and not keyword.iskeyword(name) and \
+        not name.startswith("_") and name not in _RESERVED
+
+
+def template_properties(ptg):
+    """Read the properties of a hou.ParmTemplateGroup for generate_properties().
+
+    Returns (parms, tuples, menus, folders). Folders are walked into, multiparm blocks only contribute their instance
+    count. Buttons, labels, separators and names that can't be python attributes are skipped."""
+
+    parms = []
+    tuples = []
+    menus = {}
+    folders = {}
+
+    skip = (hou.parmTemplateType.Button, hou.parmTemplateType.Label, hou.parmTemplateType.Separator)
+    multiparms = (hou.folderType.MultiparmBlock, hou.folderType.ScrollingMultiparmBlock,
+                  hou.folderType.TabbedMultiparmBlock)
+
+    stack = [(t, ()) for t in ptg.parmTemplates()[::-1]]
+
+    while stack:
+        t, path = stack.pop()
+
+        if isinstance(t, hou.FolderParmTemplate) and t.folderType() not in multiparms:
+            stack.extend((c, path + (t.label(),)) for c in t.parmTemplates()[::-1])
+            continue
+
+        if t.type() in skip or not _valid_name(t.name()):
+            continue
+
+        if t.numComponents() > 1:
+            tuples.append(t.name())
+        else:
+            parms.append(t.name())
+
+        items = t.menuItems() if hasattr(t, "menuItems") else ()
+        if items:
+            menus[t.name()] = tuple(items)
+        if path:
+            folders[t.name()] = path
+
+    return tuple(parms), tuple(tuples), menus, folders
+
+
+def _class_name(type_name):
+    """a CamelCase class name for a node type name, "rig::arm::1.0" becomes RigArm10"""
+    parts = re.split(r"[^A-Za-z0-9]+", type_name)
+    name = "".join(p[:1].upper() + p[1:] for p in parts if p)
+    if not name or name[0].isdigit():
+        name = "Node" + name
+    return name
+
+
+def cache_dir():
+    """where generated wrapper modules are kept between sessions"""
+    return os.path.join(hou.expandString("$HOUDINI_USER_PREF_DIR"), "api_gen_cache")
+
+
+def _modification_time(node_type):
+    definition = node_type.definition()
+    if definition is not None:
+        return int(definition.modificationTime())
+    # built in types only change with houdini itself
+    return re.sub(r"[^0-9]", "", hou.applicationVersionString())
+
+
+def _load_module(name, path):
+    try:
+        import importlib.util
+    except ImportError:
+        import imp
+        return imp.load_source(name, path)
+
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _replace(src, dst):
+    """move src over dst, even where dst already exists"""
+    try:
+        os.replace(src, dst)
+        return
+    except AttributeError:
+        pass
+
+    # python 2 can't rename over an existing file on windows
+    try:
+        os.remove(dst)
+    except OSError:
+        pass
+
+    try:
+        os.rename(src, dst)
+    except OSError:
+        # another session wrote the same module in the meantime
+        if not os.path.isfile(dst):
+            raise
+        os.remove(src)
+
+
+def generate_wrapper(node_type, directory=None):
+    """Return a wrapper class for the given hou.NodeType, generated from its parmTemplateGroup().
+
+    Generated modules are written to directory (cache_dir() by default) in files named after the type, a short hash
+    of its full name (types that only differ in punctuation get files of their own) and the modification time of its
+    definition, later sessions import those instead of generating them again. Stale modules of the same type are
+    removed when a new one is written."""
+
+    type_name = node_type.nameWithCategory()
+    mtime = _modification_time(node_type)
+
+    known = _wrappers.get(type_name)
+    if known is not None and known[0] == mtime:
+        return known[1]
+
+    directory = directory or cache_dir()
+    base = re.sub(r"[^A-Za-z0-9]+", "_", type_name).strip("_")
+    base += "_" + hashlib.md5(type_name.encode("utf-8")).hexdigest()[:8]
+    module_name = "api_" + base + "_" + str(mtime)
+    path = os.path.join(directory, module_name + ".py")
+    class_name = _class_name(node_type.name())
+
+    if not os.path.isfile(path):
+        parms, tuples, menus, folders = template_properties(node_type.parmTemplateGroup())
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        # only modules of this exact type, base may well be the prefix of other type names
+        stale = re.compile(r"^api_%s_\d+\.pyc?$" % re.escape(base))
+        for f in os.listdir(directory):
+            if stale.match(f):
+                os.remove(os.path.join(directory, f))
+
+        code = "# generated by api_gen.generate_wrapper() for " + type_name + ", do not edit\n\n"
+        code += generate_properties(class_name, parms, tuples, menus=menus, folders=folders)
+
+        # write under a temporary name first, so a half written module is never imported
+        tmp_path = path + ".tmp"
+        f = open(tmp_path, "w")
+        f.write(code)
+        f.close()
+        _replace(tmp_path, path)
+
+    cls = getattr(_load_module(module_name, path), class_name)
+    _wrappers[type_name] = (mtime, cls)
+
+    return cls
+
+
+def wrap(node):
+    """wrap node in the generated class of its type, see generate_wrapper()"""
+    return generate_wrapper(node.type())(node)
@@ -27,12 +27,12 @@ import hdaparmutils
 
 
 class FKControl(null_api.Null):
-    target_node = None  # type: hou.ObjNode
-    active_parms = ()
+    __slots__ = ("target_node", "active_parms")
 
-    def __init__(self, target_node, mask=511, folder=None):
+    def __init__(self, target_node, mask=511, folder=None, promote=True):
         with hou.undos.group("Create FK control"):
-            self.target_node = target_node
+            self.target_node = target_node  # type: hou.ObjNode
+            self.active_parms = ()
 
             name = self.target_node.name() + "_FK"
 
@@ -48,7 +48,9 @@ class FKControl(null_api.Null):
                 mask = int(mask, 2)
 
             self.connectparms(mask)
-            self.promoteTRS(folder=folder)
+
+            if promote:
+                self.promoteTRS(folder=folder)
 
     def connectparms(self, mask=511):
 
@@ -64,13 +66,25 @@ class FKControl(null_api.Null):
                 target_parm.lock(True)
                 self.node.parm(p).lock(True)
 
-    def promoteTRS(self, mask=511, lock_unused=True, split_vectors=(), folder=None):
-        parms = (
+    def trsTuples(self):
+        return (
             self.node.parmTuple("t"),
             self.node.parmTuple("r"),
             self.node.parmTuple("s")
         )
 
-        for p in parms:
-            hdaparmutils.promoteParm(p, folder=folder, apply_to_definition=False)
+    def promoteTRS(self, mask=511, lock_unused=True, split_vectors=(), folder=None):
+        hdaparmutils.promoteParms(self.trsTuples(), folder=folder, apply_to_definition=False)
+
+
+def buildFKControls(target_nodes, mask=511, folder=None):
+    """Create an FKControl for every target node, promoting all of their transforms with a single
+    setParmTemplateGroup() per asset rather than three per control. Returns the controls"""
+    with hou.undos.group("Create FK Controls"):
+        ctrls = tuple(FKControl(n, mask, promote=False) for n in target_nodes)
+
+        hdaparmutils.promoteParms((p for ctrl in ctrls for p in ctrl.trsTuples()), folder=folder,
+                                  apply_to_definition=False)
+
+    return ctrls
 
@@ -168,76 +168,38 @@ def createFolder(ptg, address):
 
     return ptg, ptg.findFolder(address)
 
-def promoteParm(parm, hda=None, folder=None, split_vectors=False, apply_to_definition=True, force=False, suppress_errors=True):
-    """function to promote a given Parm or ParmTuple to it's containing HDA.
-
-    parm
-        can be either a hou.Parm or hou.ParmTuple. ParmTuples have the option to be split into separate sliders.
-    hda (hou.Node)
-        the asset to which the parm with be promoted
-    folder (str)
-        name of the destination folder
-    split_vectors (bool)
-        if set to True this will promote a given parm tuple into separate sliders of matching type
-    apply_to_definition (bool)
-        if set to True the parameter will be automatically added to the assets definition, otherwise it will be
-        set to the given hda.parmTemplateGroup, the hda definition will have to be updated manually
-    force (bool)
-        grunt....
-    suppress_errors (bool)
-        burble..."""
-
-    # check we have a valid hda to promote the parm to
-    if not hda:
-        hda = parm.node().parent()
-
-    if not hda.isEditable():
-        print("Parent node is not an editable hda")
-        return
-
-    if parm.node() not in hda.allSubChildren():
-        print("Parm does not belong to a node inside the target asset...")
-        return
-
+def _promotionTarget(hda, apply_to_definition):
     # promote the parm directly to the type definition
     if apply_to_definition:
-        ptg_target = hda.type().definition()
-    else:
-        # or to the current unlocked instance
-        ptg_target = hda
-
-    ptg = ptg_target.parmTemplateGroup()
-
-    # local variable to storer whether of not the incoming parm is a tuple
-    # used later in the function when choosing a method to create channel references
-    is_tuple = False
+        return hda.type().definition()
+    # or to the current unlocked instance
+    return hda
 
-    # is it a Parm or ParmTuple?
 
-    # --- CODE FOR PARM INSTANCE ---
+def _planPromotion(parm, hda, ptg, folder=None, split_vectors=False, force=False, suppress_errors=True):
+    """add the parm template promoting parm to ptg (in memory only) and return the links to make once ptg is set,
+    a tuple of (parm or parm tuple, promoted name, clear keys) entries. See promoteParm() for the arguments"""
 
+    # if the parm is locked or hidden do nothing
     if isinstance(parm, hou.Parm):
-        # if the parm is locked or hidden do nothing
         if parm.isLocked() or parm.isHidden():
-            return
+            return ()
 
         tname = parm.node().name() + "_" + parm.name()
         tlabel = _prepname(parm.node().name().replace("_", " ") + " " + parm.name().upper())
 
-        if hda.parm(tname):
+        if ptg.find(tname):
             if force:
-                ptg.remove(hda.parm(tname).parmTemplate())
+                ptg.remove(tname)
             else:
-                parm.deleteAllKeyframes()
-                parm.set(hda.parm(tname))
-                return
+                return ((parm, tname, True),)
 
         pt = parm.parmTemplate().clone()
         pt.setName(tname)
         pt.setLabel(tlabel)
         pt.setNumComponents(1)
 
-    # --- CODE FOR PARMTUPLE INSTANCE
+        link = (parm, tname, True)
 
     elif isinstance(parm, hou.ParmTuple):
         lock_count = 0
@@ -251,15 +213,15 @@ def promoteParm(parm, hda=None, folder=None, split_vectors=False, apply_to_defin
                 unlocked = p
 
         if lock_count == len(parm) - 1:
-            return promoteParm(unlocked, hda=hda, folder=folder, apply_to_definition=apply_to_definition, suppress_errors=suppress_errors, force=force)
+            return _planPromotion(unlocked, hda, ptg, folder=folder, force=force, suppress_errors=suppress_errors)
         elif lock_count == len(parm) or unlocked is None:
-            return
+            return ()
 
-        is_tuple = True
         if split_vectors:
+            links = ()
             for p in parm:
-                promoteParm(p, hda=hda, folder=folder, apply_to_definition=apply_to_definition, suppress_errors=suppress_errors, force=force)
-            return
+                links += _planPromotion(p, hda, ptg, folder=folder, force=force, suppress_errors=suppress_errors)
+            return links
 
         tname = parm.node().name() + "_" + parm.name()
         tlabel = _prepname(parm.node().name().replace("_", " ") + " " + parm.name())
@@ -268,22 +230,18 @@ def promoteParm(parm, hda=None, folder=None, split_vectors=False, apply_to_defin
             if force:
                 ptg.remove(tname)
             else:
-                for idx, p in enumerate(parm):
-                    if p.isLocked():
-                        hda.parmTuple(tname)[idx].lock(True)
-                    else:
-                        p.deleteAllKeyframes()
-                        p.set(hda.parmTuple(tname)[idx])
-                return
+                return ((parm, tname, True),)
 
         pt = parm.parmTemplate().clone()
         pt.setName(tname)
         pt.setLabel(tlabel)
 
+        link = (parm, tname, False)
+
     else:
         if suppress_errors:
             print("Unrecognized type for " + str(parm) + "... skipping")
-            return False
+            return ()
         else:
             raise TypeError("Unrecognized type for input")
 
@@ -302,18 +260,126 @@ def promoteParm(parm, hda=None, folder=None, split_vectors=False, apply_to_defin
     else:
         ptg.addParmTemplate(pt)
 
+    return (link,)
+
+
+def _linkPromoted(hda, links):
+    """channel reference promoted parms to the parms they were promoted from"""
+    for parm, tname, clear_keys in links:
+        if isinstance(parm, hou.ParmTuple):
+            for idx, p in enumerate(parm):
+                if p.isLocked():
+                    hda.parmTuple(tname)[idx].lock(True)
+                else:
+                    if clear_keys:
+                        p.deleteAllKeyframes()
+                    p.set(hda.parmTuple(tname)[idx])
+        else:
+            parm.deleteAllKeyframes()
+            parm.set(hda.parm(tname))
+
+
+def _checkPromotion(parm, hda, members=None):
+    """members optionally holds the session ids of hda.allSubChildren(), so it needn't be walked per parm"""
+    if not hda.isEditable():
+        print("Parent node is not an editable hda")
+        return False
+
+    if members is None:
+        members = set(n.sessionId() for n in hda.allSubChildren())
+
+    if parm.node().sessionId() not in members:
+        print("Parm does not belong to a node inside the target asset...")
+        return False
+
+    return True
+
+
+def promoteParm(parm, hda=None, folder=None, split_vectors=False, apply_to_definition=True, force=False, suppress_errors=True):
+    """function to promote a given Parm or ParmTuple to it's containing HDA.
+
+    parm
+        can be either a hou.Parm or hou.ParmTuple. ParmTuples have the option to be split into separate sliders.
+    hda (hou.Node)
+        the asset to which the parm with be promoted
+    folder (str)
+        name of the destination folder
+    split_vectors (bool)
+        if set to True this will promote a given parm tuple into separate sliders of matching type
+    apply_to_definition (bool)
+        if set to True the parameter will be automatically added to the assets definition, otherwise it will be
+        set to the given hda.parmTemplateGroup, the hda definition will have to be updated manually
+    force (bool)
+        grunt....
+    suppress_errors (bool)
+        burble...
+
+    To promote many parms at once see promoteParms()."""
+
+    # check we have a valid hda to promote the parm to
+    if not hda:
+        hda = parm.node().parent()
+
+    if not _checkPromotion(parm, hda):
+        return
+
+    ptg_target = _promotionTarget(hda, apply_to_definition)
+    ptg = ptg_target.parmTemplateGroup()
+
+    links = _planPromotion(parm, hda, ptg, folder, split_vectors, force, suppress_errors)
+    if not links:
+        return
+
     ptg_target.setParmTemplateGroup(ptg)
+    _linkPromoted(hda, links)
 
-    if is_tuple:
-        for idx, p in enumerate(parm):
-            if p.isLocked():
-                hda.parmTuple(tname)[idx].lock(True)
-            else:
-                p.set(hda.parmTuple(tname)[idx])
 
-    else:
-        parm.deleteAllKeyframes()
-        parm.set(hda.parm(tname))
+def promoteParms(parms, hda=None, folder=None, split_vectors=False, apply_to_definition=True, force=False, suppress_errors=True):
+    """promote many Parms or ParmTuples like promoteParm(), setting each asset's parm template group only once.
+
+    hda defaults to the parent of each parm's node. Every template edit is made in memory first, the channel
+    references are made once the parm template groups have been set. Returns the number of links made."""
+
+    # target -> [target, ptg, ((hda, links), ...)], instances of the same asset share their definition
+    plans = {}
+    # hda session id -> session ids of everything inside it
+    members = {}
+
+    for parm in parms:
+        parm_hda = hda or parm.node().parent()
+
+        hda_members = members.get(parm_hda.sessionId())
+        if hda_members is None:
+            hda_members = set(n.sessionId() for n in parm_hda.allSubChildren())
+            members[parm_hda.sessionId()] = hda_members
+
+        if not _checkPromotion(parm, parm_hda, hda_members):
+            continue
+
+        ptg_target = _promotionTarget(parm_hda, apply_to_definition)
+        key = parm_hda.type().nameWithCategory() if apply_to_definition else parm_hda.sessionId()
+
+        plan = plans.get(key)
+        if plan is None:
+            plan = [ptg_target, ptg_target.parmTemplateGroup(), ()]
+            plans[key] = plan
+
+        links = _planPromotion(parm, parm_hda, plan[1], folder, split_vectors, force, suppress_errors)
+        plan[2] += ((parm_hda, links),)
+
+    count = 0
+
+    for ptg_target, ptg, hda_links in plans.values():
+        if not any(links for _, links in hda_links):
+            continue
+
+        ptg_target.setParmTemplateGroup(ptg)
+
+        for parm_hda, links in hda_links:
+            _linkPromoted(parm_hda, links)
+            count += len(links)
+
+    return count
 
 
 def removeParms(parms, node=None, apply_to_definition=False):
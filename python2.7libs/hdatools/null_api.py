@@ -41,45 +41,90 @@
 # this file was generated by api_gen.generate_properties()
 
 class Null(object):
+    __slots__ = ("node", "_parms", "_tuples")
+
+    PARMS = ('geoscale', 'controltype', 'orientation', 'shadedmode')
+    TUPLES = ('dcolor',)
+
     def __init__(self, node):
         self.node = node
+        self._parms = {}
+        self._tuples = {}
+
+    def _parm(self, name):
+        parm = self._parms.get(name)
+        if parm is None:
+            parm = self.node.parm(name)
+            self._parms[name] = parm
+        return parm
+
+    def _parmTuple(self, name):
+        tup = self._tuples.get(name)
+        if tup is None:
+            tup = self.node.parmTuple(name)
+            self._tuples[name] = tup
+        return tup
+
+    def refresh(self):
+        """drop the cached parm handles, e.g. after the node's parm templates changed"""
+        self._parms.clear()
+        self._tuples.clear()
+
+    def get_many(self, names=None):
+        """the values of the given properties, all of them by default"""
+        if names is None:
+            names = self.PARMS + self.TUPLES
+        return tuple(getattr(self, n) for n in names)
+
+    def set_many(self, names, values):
+        for n, v in zip(names, values):
+            setattr(self, n, v)
+
+    def to_dict(self):
+        return dict(zip(self.PARMS + self.TUPLES, self.get_many()))
+
+    def from_dict(self, values):
+        for n, v in values.items():
+            if n not in self.PARMS and n not in self.TUPLES:
+                raise AttributeError("Null has no property " + n)
+            setattr(self, n, v)
 
     @property
     def geoscale(self):
-        return self.node.evalParm("geoscale")
-    
+        return self._parm("geoscale").eval()
+
     @geoscale.setter
     def geoscale(self, value):
-        self.node.parm("geoscale").set(value)  
+        self._parm("geoscale").set(value)
 
     @property
     def controltype(self):
-        return self.node.evalParm("controltype")
-    
+        return self._parm("controltype").eval()
+
     @controltype.setter
     def controltype(self, value):
-        self.node.parm("controltype").set(value)  
+        self._parm("controltype").set(value)
 
     @property
     def orientation(self):
-        return self.node.evalParm("orientation")
-    
+        return self._parm("orientation").eval()
+
     @orientation.setter
     def orientation(self, value):
-        self.node.parm("orientation").set(value)  
+        self._parm("orientation").set(value)
 
     @property
     def shadedmode(self):
-        return self.node.evalParm("shadedmode")
-    
+        return self._parm("shadedmode").eval()
+
     @shadedmode.setter
     def shadedmode(self, value):
-        self.node.parm("shadedmode").set(value)  
+        self._parm("shadedmode").set(value)
 
     @property
     def dcolor(self):
-        return self.node.evalParmTuple("dcolor")
+        return self._parmTuple("dcolor").eval()
 
     @dcolor.setter
     def dcolor(self, value):
-        self.node.parmTuple("dcolor").set(value)  
+        self._parmTuple("dcolor").set(value)
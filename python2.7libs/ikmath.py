@@ -0,0 +1,252 @@
+import numpy
+
+# numpy IK maths for chains of any length, batched over frames.
+#
+# Chains are given as (frames, joints, 3) arrays of joint positions running from the root of the first bone to the tip
+# of the last bone, so a chain of N bones has N + 1 joints. Everything here is pure numpy so it can run per frame
+# during range bakes or interactively while snapping.
+
+
+def _unit(v):
+    length = numpy.linalg.norm(v, axis=-1)
+    return v / numpy.where(length > 0.0, length, 1.0)[..., None]
+
+
+def chainJoints(roots, tips):
+    """(frames, bones + 1, 3) joint positions from (frames, bones, 3) roots and tips"""
+    return numpy.concatenate((roots, tips[:, -1:]), axis=1)
+
+
+def poleJoint(joints):
+    """index of the inner joint furthest from the line between the chain's root and end, per frame. One bone chains
+    have no inner joint, the root (0) is returned for them"""
+    if joints.shape[1] < 3:
+        return numpy.zeros(len(joints), dtype=int)
+
+    base = joints[:, :1]
+    axis = _unit(joints[:, -1:] - base)
+
+    offsets = joints[:, 1:-1] - base
+    along = numpy.sum(offsets * axis, axis=-1)[..., None] * axis
+    dist = numpy.linalg.norm(offsets - along, axis=-1)
+
+    return numpy.argmax(dist, axis=-1) + 1
+
+
+def fitPlanes(points):
+    """Fit planes through (..., points, 3) arrays of points, e.g. the joints of many chains over many frames, in one
+    stacked SVD.
+
+    Returns the (..., 3) centroids, the (..., 3) unit normals and the (..., 3) singular values, largest first. The
+    normals are only meaningful where the second singular value isn't ~0, i.e. the points don't lie on a line."""
+    points = numpy.asarray(points, dtype=float)
+    centroids = numpy.mean(points, axis=-2)
+
+    _, s, vh = numpy.linalg.svd(points - centroids[..., None, :])
+    if s.shape[-1] < 3:
+        s = numpy.concatenate((s, numpy.zeros(s.shape[:-1] + (3 - s.shape[-1],))), axis=-1)
+
+    return centroids, vh[..., 2, :], s
+
+
+def _perpendicular(axis):
+    """any unit vector perpendicular to each row of axis"""
+    up = numpy.where((numpy.abs(axis[:, 1]) < 0.9)[:, None], [[0.0, 1.0, 0.0]], [[1.0, 0.0, 0.0]])
+    return _unit(numpy.cross(axis, up))
+
+
+def chainNormals(joints, continuous=True, tolerance=1e-6):
+    """(frames, 3) unit normals of the planes the chains bend in, from fitPlanes() over all of their joints.
+
+    The normals face the way of cross(bend - root, end - root), as set_twist_pos() always had it. Straight chains
+    have no plane of their own, with continuous they keep the plane of the closest bent frame (rows are treated as
+    consecutive frames of one chain), otherwise an arbitrary plane through the chain is used. Chains that are straight
+    on every frame, e.g. single bones, start from an arbitrary plane that continuous then carries along."""
+    joints = numpy.asarray(joints, dtype=float)
+    _, normals, s = fitPlanes(joints)
+
+    base = joints[:, 0]
+    end = joints[:, -1]
+    bend = joints[numpy.arange(len(joints)), poleJoint(joints)]
+    axis = _unit(end - base)
+
+    flip = numpy.sum(normals * numpy.cross(bend - base, end - base), axis=-1) < 0.0
+    normals = numpy.where(flip[:, None], -normals, normals)
+
+    straight = s[:, 1] <= tolerance * numpy.maximum(s[:, 0], 1e-12)
+    if not straight.any():
+        return normals
+
+    fallback = _perpendicular(axis)
+
+    if not continuous:
+        return numpy.where(straight[:, None], fallback, normals)
+
+    # carry the closest bent frame's plane over (or the first frame's arbitrary one), kept perpendicular to the chain
+    bent = numpy.flatnonzero(~straight)
+    first = bent[0] if len(bent) else 0
+    if not len(bent):
+        normals[0] = fallback[0]
+
+    for f in numpy.flatnonzero(straight):
+        if f == first:
+            continue
+        src = normals[f - 1] if f > first else normals[first]
+        n = src - numpy.dot(src, axis[f]) * axis[f]
+        length = numpy.linalg.norm(n)
+        normals[f] = n / length if length > 1e-9 else fallback[f]
+
+    return normals
+
+
+def poleDirections(joints, continuous=True):
+    """Unit direction from the root-end line towards the bend of the chain, per frame.
+
+    For two bone chains this is the direction IK_Chain.set_twist_pos() has always used: the normal of the plane through
+    the root, the bend and the end, crossed with the direction from the end back to the root. Longer chains use the
+    best fit plane through all of their joints, see chainNormals()."""
+    base = joints[:, 0]
+    end = joints[:, -1]
+
+    return _unit(numpy.cross(chainNormals(joints, continuous), _unit(base - end)))
+
+
+def boneBases(joints, normals, axis="x"):
+    """(frames, bones, 3, 3) rotations (rows are the x, y, z axes, like hou.Matrix3) that point every bone along its
+    chain and roll its given axis ("x" or "y") onto the chain's plane normal"""
+    if axis not in ("x", "y"):
+        raise ValueError("axis must be either 'x' or 'y'")
+
+    # bones point down their -z axis
+    z = _unit(joints[:, :-1] - joints[:, 1:])
+    n = numpy.broadcast_to(normals[:, None], z.shape)
+
+    flat = n - numpy.sum(n * z, axis=-1)[..., None] * z
+    flat = _unit(flat)
+
+    if axis == "x":
+        x = flat
+        y = numpy.cross(z, x)
+    else:
+        y = flat
+        x = numpy.cross(y, z)
+
+    return numpy.stack((x, y, z), axis=-2)
+
+
+def endGoalPositions(joints, offset=0.001):
+    """(frames, 3) end goal positions just past the tip of the last bone"""
+    return joints[:, -1] + _unit(joints[:, -1] - joints[:, -2]) * offset
+
+
+def twistGoalPositions(joints, dist=None):
+    """(frames, 3) twist goal positions, out from the bend of the chain along poleDirections(). dist defaults to the
+    distance from the root to the bend. The bend of a one bone chain is the middle of the bone"""
+    frames = numpy.arange(len(joints))
+
+    if joints.shape[1] < 3:
+        bend = (joints[:, 0] + joints[:, -1]) * 0.5
+    else:
+        bend = joints[frames, poleJoint(joints)]
+
+    if dist is None:
+        dist = numpy.linalg.norm(bend - joints[:, 0], axis=-1)
+
+    return bend + poleDirections(joints) * numpy.reshape(dist, (-1, 1))
+
+
+def _applyPoles(p, poles):
+    """rotate every inner joint about the line through its neighbours so it faces the pole"""
+    for i in range(1, p.shape[1] - 1):
+        axis = _unit(p[:, i + 1] - p[:, i - 1])
+
+        def _flat(v):
+            v = v - p[:, i - 1]
+            return v - numpy.sum(v * axis, axis=-1)[:, None] * axis
+
+        joint = _flat(p[:, i])
+        target = _flat(poles)
+
+        radius = numpy.linalg.norm(joint, axis=-1)
+        valid = (radius > 1e-9) & (numpy.linalg.norm(target, axis=-1) > 1e-9)
+
+        moved = p[:, i] - joint + _unit(target) * radius[:, None]
+        p[:, i] = numpy.where(valid[:, None], moved, p[:, i])
+
+
+def fabrik(joints, targets, poles=None, iterations=20, tolerance=1e-4):
+    """Solve chains towards targets with FABRIK (forward and backward reaching inverse kinematics).
+
+    joints
+        (frames, joints, 3) starting joint positions, bone lengths are taken from them
+    targets
+        (frames, 3) positions for the end of each chain
+    poles
+        optional (frames, 3) positions the bends of the chains should face
+
+    The root of each chain stays in place. Targets out of reach leave the chain straightened towards them.
+    Returns the solved (frames, joints, 3) positions."""
+
+    p = numpy.array(joints, dtype=float, copy=True)
+    targets = numpy.asarray(targets, dtype=float)
+
+    lengths = numpy.linalg.norm(numpy.diff(p, axis=1), axis=-1)
+    base = p[:, 0].copy()
+
+    reach = numpy.linalg.norm(targets - base, axis=-1)
+    unreachable = reach >= numpy.sum(lengths, axis=-1)
+
+    if poles is not None:
+        poles = numpy.asarray(poles, dtype=float)
+        _applyPoles(p, poles)
+
+    count = p.shape[1]
+
+    for _ in range(iterations):
+        # backward, from the target to the root
+        p[:, -1] = targets
+        for i in range(count - 2, -1, -1):
+            p[:, i] = p[:, i + 1] + _unit(p[:, i] - p[:, i + 1]) * lengths[:, i, None]
+
+        # forward, from the root back out
+        p[:, 0] = base
+        for i in range(count - 1):
+            p[:, i + 1] = p[:, i] + _unit(p[:, i + 1] - p[:, i]) * lengths[:, i, None]
+
+        if poles is not None:
+            _applyPoles(p, poles)
+
+        error = numpy.linalg.norm(p[:, -1] - targets, axis=-1)
+        if numpy.all((error < tolerance) | unreachable):
+            break
+
+    # straighten chains that can't reach
+    if unreachable.any():
+        direction = _unit(targets - base)[:, None]
+        straight = base[:, None] + direction * numpy.concatenate(
+            (numpy.zeros((len(p), 1)), numpy.cumsum(lengths, axis=-1)), axis=-1)[..., None]
+        p[unreachable] = straight[unreachable]
+
+    return p
+
+
+def alignMatrices(a, b):
+    """(N, 3, 3) column vector rotations taking the directions a onto b along the shortest arc"""
+    a = _unit(numpy.asarray(a, dtype=float))
+    b = _unit(numpy.asarray(b, dtype=float))
+
+    v = numpy.cross(a, b)
+    c = numpy.sum(a * b, axis=-1)
+
+    vx = numpy.zeros((len(a), 3, 3))
+    vx[:, 0, 1] = -v[:, 2]
+    vx[:, 0, 2] = v[:, 1]
+    vx[:, 1, 0] = v[:, 2]
+    vx[:, 1, 2] = -v[:, 0]
+    vx[:, 2, 0] = -v[:, 1]
+    vx[:, 2, 1] = v[:, 0]
+
+    # rodrigues, a and b pointing in opposite directions has no unique answer and is left unrotated
+    factor = numpy.where(c > -1.0 + 1e-9, 1.0 / (1.0 + numpy.where(c > -1.0 + 1e-9, c, 0.0)), 0.0)
+
+    return numpy.eye(3)[None] + vx + numpy.matmul(vx, vx) * factor[:, None, None]
@@ -1,18 +1,307 @@
-import hou
+import contextlib
+import numpy
+import weakref
+import channelmodel
+import rotmath
+from bisect import bisect_left, bisect_right
 
+try:
+    import hou
+except ImportError:
+    # channelmodel channels can still be keyed, tweened and interpolated, see undoGroup() and newKeyframe()
+    hou = None
+
+# raised for anything that can't be keyed, hou.Error within a Houdini session
+Error = RuntimeError if hou is None else hou.Error
+
+# the expression language of keys written here, None for channelmodel keys outside of a Houdini session
+HSCRIPT = None if hou is None else hou.exprLanguage.Hscript
+
+
+@contextlib.contextmanager
+def _noUndo():
+    yield
+
+
+def undoGroup(label):
+    """hou.undos.group(label), or a context that does nothing without hou"""
+    if hou is None:
+        return _noUndo()
+    return hou.undos.group(label)
+
+
+def newKeyframe(parm):
+    """an empty keyframe to write to parm, a channelmodel.Keyframe when parm is a channelmodel.Channel"""
+    if isinstance(parm, channelmodel.Channel):
+        return channelmodel.Keyframe()
+    return hou.Keyframe()
+
+
+
+class ChannelSnapshot(object):
+    """A read-once copy of the keyframes on a single parm.
+
+    The keys are fetched from hou a single time and stored sorted by frame, alongside plain tuples of their frames and
+    values. The query methods mirror the hou.Parm methods of the same name (and answer them with bisect) so a snapshot
+    can be passed anywhere these functions expect a parm to be queried for keys.
+
+    Snapshots don't notice changes to the parm by themselves, call invalidate() after writing keys, or create them
+    through channelSnapshot() which invalidates them from node event callbacks."""
+
+    def __init__(self, parm):
+        self.parm = parm
+        self.keys = ()
+        self.frames = ()
+        self.values = ()
+        self.valid = False
+
+        self.refresh()
+
+    def refresh(self):
+        keys = sorted(self.parm.keyframes(), key=lambda k: k.frame())
+
+        self.keys = tuple(keys)
+        self.frames = tuple(k.frame() for k in keys)
+
+        if isinstance(self.parm.parmTemplate(), hou.StringParmTemplate):
+            self.values = tuple(k.expression() for k in keys)
+        else:
+            self.values = tuple(k.value() for k in keys)
+
+        self.valid = True
+
+    def invalidate(self):
+        self.valid = False
+
+    def _check(self):
+        if not self.valid:
+            self.refresh()
+
+    def keyframes(self):
+        self._check()
+        return self.keys
+
+    def keyframesBefore(self, frame):
+        """keys at or before the given frame"""
+        self._check()
+        return self.keys[:bisect_right(self.frames, frame)]
+
+    def keyframesAfter(self, frame):
+        """keys at or after the given frame"""
+        self._check()
+        return self.keys[bisect_left(self.frames, frame):]
+
+    def keyframesInRange(self, start_frame, end_frame):
+        self._check()
+        return self.keys[bisect_left(self.frames, start_frame):bisect_right(self.frames, end_frame)]
+
+    def keyframeAtFrame(self, frame):
+        """the key at the given frame, or None"""
+        keys = self.keyframesInRange(frame, frame)
+        if keys:
+            return keys[0]
+        return None
+
+
+# snapshots created through channelSnapshot(), keyed by (node session id, parm name)
+_snapshots = {}
+# session ids of the nodes we've attached invalidation callbacks to
+_watched_nodes = set()
+
+
+def _snapshotKey(parm):
+    return parm.node().sessionId(), parm.name()
+
+
+def _onNodeEvent(**kwargs):
+    node = kwargs["node"]
+    event_type = kwargs["event_type"]
+    tup = kwargs.get("parm_tuple")
+
+    if tup is not None:
+        invalidateSnapshots(tup)
+        return
+
+    sid = node.sessionId()
+
+    for key in [k for k in _snapshots if k[0] == sid]:
+        if event_type == hou.nodeEventType.BeingDeleted:
+            del _snapshots[key]
+        else:
+            _snapshots[key].invalidate()
+
+    if event_type == hou.nodeEventType.BeingDeleted:
+        _watched_nodes.discard(sid)
+
+
+def _watchNode(node):
+    if node.sessionId() in _watched_nodes:
+        return
+
+    node.addEventCallback((hou.nodeEventType.ParmTupleChanged,
+                           hou.nodeEventType.ParmTupleAnimated,
+                           hou.nodeEventType.ParmTupleChannelChanged,
+                           hou.nodeEventType.BeingDeleted), _onNodeEvent)
+
+    _watched_nodes.add(node.sessionId())
+
+
+def channelSnapshot(parm, watch=True):
+    """return the cached ChannelSnapshot of the given parm, creating it if needed.
+    With watch set, the parm's node gets an event callback that invalidates its snapshots whenever its parms change."""
+
+    key = _snapshotKey(parm)
+    snap = _snapshots.get(key)
+
+    if snap is None:
+        snap = ChannelSnapshot(parm)
+        _snapshots[key] = snap
+
+        if watch:
+            _watchNode(parm.node())
+
+    return snap
+
+
+def invalidateSnapshots(parms=None):
+    """invalidate the cached snapshots of the given parms (or parm tuple), or all of them if parms is None"""
+
+    if parms is None:
+        for snap in _snapshots.values():
+            snap.invalidate()
+        return
+
+    for p in parms:
+        snap = _snapshots.get(_snapshotKey(p))
+        if snap is not None:
+            snap.invalidate()
+
+
+class KeyIndex(object):
+    """A frame -> keyed parms lookup across a set of nodes.
+
+    Every parm of the given nodes is read once when the index is built. Afterwards the index is kept up to date
+    incrementally whenever keys are written through the functions in this module, or by calling update() with the
+    parms that changed elsewhere.
+
+    index = KeyIndex.fromSubnet(hou.node("/obj/rig"))
+    index.parmsAtFrame(1001)"""
+
+    def __init__(self, nodes):
+        self.nodes = tuple(nodes)
+        self._node_ids = set(n.sessionId() for n in self.nodes)
+        # parms are keyed by (node session id, parm name) like the snapshots, so renaming a node doesn't orphan them
+        # frame -> {parm key: parm}
+        self._by_frame = {}
+        # parm key -> tuple of keyed frames
+        self._by_parm = {}
+
+        for n in self.nodes:
+            for p in n.parms():
+                self._add(p, tuple(k.frame() for k in p.keyframes()))
+
+        _key_indices.add(self)
+
+    @classmethod
+    def fromSubnet(cls, subnet):
+        """index the given subnet and everything inside it"""
+        return cls((subnet,) + subnet.allSubChildren())
+
+    def _add(self, parm, frames):
+        if not frames:
+            return
+
+        key = _snapshotKey(parm)
+        self._by_parm[key] = frames
+
+        for f in frames:
+            self._by_frame.setdefault(f, {})[key] = parm
+
+    def _remove(self, parm):
+        key = _snapshotKey(parm)
+
+        for f in self._by_parm.pop(key, ()):
+            parms = self._by_frame.get(f)
+            if parms is None:
+                continue
+
+            parms.pop(key, None)
+            if not parms:
+                del self._by_frame[f]
+
+    def tracks(self, node):
+        return node.sessionId() in self._node_ids
+
+    def update(self, parms):
+        """re-read the keys of the given parms, parms of nodes outside the index are ignored"""
+        for p in parms:
+            if not self.tracks(p.node()):
+                continue
+
+            self._remove(p)
+            self._add(p, tuple(k.frame() for k in p.keyframes()))
+
+    def frames(self):
+        """all keyed frames in the index, sorted"""
+        return tuple(sorted(self._by_frame))
+
+    def parmsAtFrame(self, frame, node=None):
+        """parms keyed at the given frame, optionally only those belonging to node"""
+        parms = self._by_frame.get(frame, {})
+
+        if node is not None:
+            sid = node.sessionId()
+            return tuple(p for key, p in parms.items() if key[0] == sid)
+
+        return tuple(parms.values())
+
+    def keyedFrames(self, parm):
+        return self._by_parm.get(_snapshotKey(parm), ())
+
+
+# live KeyIndex instances, updated by keysChanged()
+_key_indices = weakref.WeakSet()
+
+
+def keysChanged(parms):
+    """Update the snapshots and KeyIndex instances after keys were written to the given parms. Called by every
+    function here that writes keys, call it after writing keys elsewhere, e.g. from retime or keyreduce."""
+    # channelmodel channels have no snapshots and aren't indexed
+    if hou is None:
+        return
+    parms = tuple(p for p in parms if isinstance(p, hou.Parm))
+
+    invalidateSnapshots(parms)
+
+    for index in tuple(_key_indices):
+        index.update(parms)
+
+
+def _channel(parm, cache):
+    """the object to query keys from, either the parm itself or its cached snapshot"""
+    if cache and hou is not None and isinstance(parm, hou.Parm):
+        return channelSnapshot(parm)
+    return parm
+
+
+def isString(tup):
+    """True for string parm tuples, channelmodel tuples are always numeric"""
+    if isinstance(tup, channelmodel.ChannelTuple):
+        return False
+    return isinstance(tup.parmTemplate(), hou.StringParmTemplate)
 
 
 def keyParmTuple(tup, frame, value=None, onlykeyed=False):
 
     """Set keys on all parms within a given parm tuple."""
 
-    is_string = isinstance(tup.parmTemplate(), hou.StringParmTemplate)
+    is_string = isString(tup)
 
     # Removing support for string parms temporarily until everything else is locked down
     if is_string:
         return
 
-    with hou.undos.group("Key ParmTuple"):
+    with undoGroup("Key ParmTuple"):
 
         if not isinstance(value, tuple):
             value = (value,) * len(tup)
@@ -24,7 +313,7 @@ def keyParmTuple(tup, frame, value=None, onlykeyed=False):
             if is_string:
                 key = hou.StringKeyframe()
             else:
-                key = hou.Keyframe()
+                key = newKeyframe(p)
 
             if len(value) > idx and value[idx] is not None:
                 if is_string:
@@ -44,42 +333,125 @@ def keyParmTuple(tup, frame, value=None, onlykeyed=False):
                 key.setSlopeAuto(True)
             p.setKeyframe(key)
 
+    keysChanged(tup)
+
+    return key
+
+
+def _componentValue(value, idx):
+    """pick the value for component idx out of a per-frame value, which may be a scalar, a tuple or None"""
+    if value is None:
+        return None
+
+    if hasattr(value, "__len__"):
+        if len(value) > idx:
+            return value[idx]
+        return None
+
+    return value
+
+
+def _autoKey(frame, value, parm):
+    key = newKeyframe(parm)
+    key.setFrame(frame)
+    key.setValue(float(value))
+    key.setInSlopeAuto(True)
+    key.setSlopeAuto(True)
+
     return key
 
 
-def moveParmTupleKey(tup, cur_frame, new_frame):
+def keyParmTuples(tuples, frames, values=None, onlykeyed=False):
+    """Set keys on many parm tuples across many frames.
+
+    tuples
+        a sequence of hou.ParmTuple
+    frames
+        a sequence of frames to key, e.g. range(1001, 1101)
+    values
+        optional, one entry per tuple holding one value per frame. Each per-frame value follows the same rules as
+        keyParmTuple(): a scalar, a tuple of components or None to key the currently evaluated value. Anything
+        indexable works, so a frames x components numpy array per tuple is fine.
+
+    All keys are built before anything is written, then each parm receives a single setKeyframes() call, all within
+    one undo group. Returns the number of keys written."""
+
+    frames = tuple(frames)
+    plan = ()
+
+    for t_idx, tup in enumerate(tuples):
+        # string parms are skipped to match keyParmTuple()
+        if isString(tup):
+            continue
+
+        tup_values = values[t_idx] if values is not None else None
+
+        for idx, p in enumerate(tup):
+            if p.isLocked() or (onlykeyed and not p.keyframes()):
+                continue
+
+            keys = ()
+
+            for f_idx, frame in enumerate(frames):
+                v = None
+                if tup_values is not None:
+                    v = _componentValue(tup_values[f_idx], idx)
+
+                if v is None:
+                    v = p.evalAtFrame(frame)
+
+                keys += (_autoKey(frame, v, p),)
+
+            plan += ((p, keys),)
+
+    count = 0
 
-    with hou.undos.group("Move Parm Tuple Keyframe"):
+    with undoGroup("Key ParmTuples"):
+        for p, keys in plan:
+            p.setKeyframes(keys)
+            count += len(keys)
+
+    keysChanged(p for p, keys in plan)
+
+    return count
+
+
+def moveParmTupleKey(tup, cur_frame, new_frame, cache=False):
+
+    with undoGroup("Move Parm Tuple Keyframe"):
         for p in tup:
             # as we're querying a frame range of length 1, we can safely use the [0] index of the result
-            k = p.keyframesInRange(cur_frame, cur_frame)[0]
+            k = _channel(p, cache).keyframesInRange(cur_frame, cur_frame)[0]
 
             k.setFrame(new_frame)
 
             p.deleteKeyframeAtFrame(cur_frame)
             p.setKeyframe(k)
 
+    keysChanged(tup)
+
 
-def tweenParmTuple(tup, valuebias=0.5, timingbias=0.5, ref_frame=None, keyatref=True):
+def tweenParmTuple(tup, valuebias=0.5, timingbias=0.5, ref_frame=None, keyatref=True, cache=False):
 
     print(tup)
 
     if not ref_frame:
         ref_frame = hou.frame()
 
-    with hou.undos.group("Tween ParmTuple"):
+    with undoGroup("Tween ParmTuple"):
 
         prevframes = ()
         nextframes = ()
 
         for p in tup:
-            if p.keyframesBefore(ref_frame):
-                prevframes += (p.keyframesBefore(ref_frame)[-1],)
-            if p.keyframesAfter(ref_frame):
-                nextframes += (p.keyframesAfter(ref_frame)[0],)
+            ch = _channel(p, cache)
+            if ch.keyframesBefore(ref_frame):
+                prevframes += (ch.keyframesBefore(ref_frame)[-1],)
+            if ch.keyframesAfter(ref_frame):
+                nextframes += (ch.keyframesAfter(ref_frame)[0],)
 
         if not prevframes or not nextframes:
-            raise hou.Error("no surrounding keys")
+            raise Error("no surrounding keys")
 
         k1 = max(prevframes)
         k2 = min(nextframes)
@@ -96,6 +468,130 @@ def tweenParmTuple(tup, valuebias=0.5, timingbias=0.5, ref_frame=None, keyatref=
 
         return keyParmTuple(tup, int(out_f), out_v, onlykeyed=True)
 
+
+def transformTuples(nodes=None, names=("t", "r", "s")):
+    """return the transform parm tuples of the given nodes, or of the current selection if none are given"""
+    if nodes is None:
+        nodes = hou.selectedNodes()
+
+    out = ()
+
+    for n in nodes:
+        for name in names:
+            tup = n.parmTuple(name)
+            if tup is not None:
+                out += (tup,)
+
+    return out
+
+
+def tweenParmTuples(tuples=None, valuebias=0.5, timingbias=0.5, ref_frame=None, keyatref=True, cache=False):
+    """Tween many parm tuples in one pass, by default the transform tuples of every selected node.
+
+    Behaves like calling tweenParmTuple() on each tuple, except that the surrounding keys of each parm are only
+    queried once, all lerps and slerps are computed together as numpy arrays and the results are written within a
+    single undo group. Tuples without surrounding keys are skipped rather than raising, unless none of them can be
+    tweened. Returns the tuples that were keyed."""
+
+    if tuples is None:
+        tuples = transformTuples()
+
+    if not ref_frame:
+        ref_frame = hou.frame()
+
+    lerp_items = ()
+    slerp_items = ()
+
+    for tup in tuples:
+        if isString(tup):
+            continue
+
+        prevframes = ()
+        nextframes = ()
+        keyed = ()
+
+        for p in tup:
+            ch = _channel(p, cache)
+            before = ch.keyframesBefore(ref_frame)
+            after = ch.keyframesAfter(ref_frame)
+
+            if before:
+                prevframes += (before[-1].frame(),)
+            if after:
+                nextframes += (after[0].frame(),)
+
+            keyed += (bool(before or after or ch.keyframes()),)
+
+        if not prevframes or not nextframes:
+            continue
+
+        f1 = max(prevframes)
+        f2 = min(nextframes)
+
+        item = (tup, keyed, f1, f2, tup.evalAtFrame(f1), tup.evalAtFrame(f2))
+
+        if isCompleteRotate(tup):
+            slerp_items += (item,)
+        else:
+            lerp_items += (item,)
+
+    if not lerp_items and not slerp_items:
+        raise Error("no surrounding keys")
+
+    results = ()
+
+    if lerp_items:
+        # components are flattened so tuples of any size can share one array
+        v1 = numpy.array([v for item in lerp_items for v in item[4]], dtype=float)
+        v2 = numpy.array([v for item in lerp_items for v in item[5]], dtype=float)
+        out = v1 + ((v2 - v1) * valuebias)
+
+        start = 0
+        for item in lerp_items:
+            end = start + len(item[4])
+            results += ((item, out[start:end]),)
+            start = end
+
+    # rotates are slerped in one batch per rotate order
+    by_order = {}
+    for item in slerp_items:
+        by_order.setdefault(rotateOrder(item[0]), []).append(item)
+
+    for order, items in by_order.items():
+        r1 = numpy.array([item[4][:3] for item in items], dtype=float)
+        r2 = numpy.array([item[5][:3] for item in items], dtype=float)
+
+        q1 = rotmath.eulerToQuat(r1, order)
+        q2 = rotmath.eulerToQuat(r2, order)
+        out = rotmath.quatToEuler(rotmath.slerp(q1, q2, valuebias), order)
+        # stay on the same side of any flips as the previous key
+        out = rotmath.closestEuler(out, r1, order)
+
+        for idx, item in enumerate(items):
+            results += ((item, out[idx]),)
+
+    keyed_tuples = ()
+
+    with undoGroup("Tween ParmTuples"):
+        for item, values in results:
+            tup, keyed, f1, f2 = item[:4]
+
+            if keyatref:
+                out_f = ref_frame
+            else:
+                out_f = f1 + ((f2 - f1) * timingbias)
+
+            for idx, p in enumerate(tup):
+                if not keyed[idx] or idx >= len(values):
+                    continue
+                p.setKeyframe(_autoKey(int(out_f), values[idx], p))
+
+            keyed_tuples += (tup,)
+
+    keysChanged(p for tup in keyed_tuples for p in tup)
+
+    return keyed_tuples
+
 # class rotateKeyframe:
 #     def __init__(self):
 
@@ -128,17 +624,31 @@ def lerpParmTuple(tup, t1, t2, bias):
 
 def slerpParmTuple(tup, t1, t2, bias):
     if not isCompleteRotate(tup):
-        raise hou.Error(str(tup) + " is not a value set of euler rotates")
+        raise Error(str(tup) + " is not a value set of euler rotates")
+
+    order = rotateOrder(tup)
 
     r1 = tup.evalAtFrame(t1)
     r2 = tup.evalAtFrame(t2)
 
-    q1 = hou.Quaternion(hou.hmath.buildRotate(r1))
-    q2 = hou.Quaternion(hou.hmath.buildRotate(r2))
+    q1 = rotmath.eulerToQuat(r1, order)
+    q2 = rotmath.eulerToQuat(r2, order)
+
+    out = rotmath.quatToEuler(rotmath.slerp(q1, q2, bias), order)
 
-    outq = q1.slerp(q2, bias)
+    return tuple(rotmath.closestEuler(out, r1, order)[0])
+
+
+def rotateOrder(tup):
+    """the rotate order of the node the given tuple belongs to, 'xyz' for nodes without an rOrd parm"""
+    if isinstance(tup, channelmodel.ChannelTuple):
+        return tup.rotate_order or "xyz"
+
+    parm = tup.node().parm("rOrd")
+    if parm is None:
+        return "xyz"
+    return parm.evalAsString()
 
-    return tuple(outq.extractEulerRotates())
 
 # When interpolating a parm that's part of a full set of rotates we want to know if the full set of rotates is available
 # if so, perform slerping of their values. The conditions for this are as follows:
@@ -156,6 +666,10 @@ def isCompleteRotate(tup):
 
     """Returns is the given parm tuple represents a full set of Euler Rotates"""
 
+    # channelmodel tuples are rotates when they were given a rotate order
+    if isinstance(tup, channelmodel.ChannelTuple):
+        return len(tup) == 3 and tup.rotate_order is not None
+
     bool = True
 
     if len(tup) < 3:
@@ -187,30 +701,98 @@ def isCompleteRotate(tup):
     return bool
 
 
-def keysAtFrame(node, frame=hou.frame()):
+def keysAtFrame(node, frame=None, cache=False, index=None):
+    """return the parms of node keyed at the given frame (the current frame by default).
+    Given a KeyIndex covering node the answer is looked up rather than scanning every parm."""
+
+    if frame is None:
+        frame = hou.frame()
+
+    if index is not None and index.tracks(node):
+        return index.parmsAtFrame(frame, node=node)
 
     result =()
 
     for p in node.parms():
-        if p.keyframesInRange(frame, frame):
+        if _channel(p, cache).keyframesInRange(frame, frame):
             result += (p,)
 
     return result
 
-def tupleKeyedIndices(tup):
+def tupleKeyedIndices(tup, cache=False):
     indices = ()
     for idx, p in enumerate(tup):
-        if p.keyframes():
+        if _channel(p, cache).keyframes():
             indices += (idx,)
 
     return indices
 
 def setInterpolation(tup, interp):
-    for p in tup:
-        keys = p.keyframes()
+    return setInterpolations((tup,), interp)
+
+
+def parmsOf(targets):
+    """flatten a mix of nodes, parm tuples (or channelmodel tuples) and parms into parms"""
+    for t in targets:
+        if isinstance(t, channelmodel.ChannelTuple) or (hou is not None and isinstance(t, hou.ParmTuple)):
+            for p in t:
+                yield p
+        elif hou is not None and isinstance(t, hou.Node):
+            for p in t.parms():
+                yield p
+        else:
+            yield t
+
+
+def setInterpolations(targets, interp, ranges=None):
+    """Set the interpolation function (e.g. "linear", "bezier") of the keys on many parms.
+
+    targets
+        any mix of hou.Node, hou.ParmTuple and hou.Parm, nodes contribute all of their parms
+    ranges
+        optional sequence of (start, end) frame ranges, only keys within them are changed
+
+    Keys already using the function are left alone and parms with nothing to change are not written at all, the
+    others are written once each within a single undo group. Returns the number of keys changed."""
+
+    expr = interp + "()"
+    plan = ()
+
+    for p in parmsOf(targets):
+        if ranges is None:
+            keys = p.keyframes()
+        else:
+            # frame -> key, so keys within overlapping ranges are only changed and counted once
+            in_ranges = {}
+            for start, end in ranges:
+                for k in p.keyframesInRange(start, end):
+                    in_ranges[k.frame()] = k
+            keys = tuple(in_ranges[f] for f in sorted(in_ranges))
+
+        changed = ()
+
+        # channels only store the function, so the language of their keys doesn't matter
+        is_channel = isinstance(p, channelmodel.Channel)
 
         for k in keys:
-            k.setExpression(interp + "()", hou.exprLanguage.Hscript)
+            if k.isExpressionSet() and k.expression() == expr and (is_channel or k.expressionLanguage() == HSCRIPT):
+                continue
+
+            k.setExpression(expr, HSCRIPT)
+            changed += (k,)
+
+        if changed:
+            plan += ((p, changed),)
+
+    count = 0
+
+    if plan:
+        with undoGroup("Set Interpolation"):
+            for p, keys in plan:
+                p.setKeyframes(keys)
+                count += len(keys)
+
+        keysChanged(p for p, keys in plan)
 
-        p.setKeyframes(keys)
+    return count
 
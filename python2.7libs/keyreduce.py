@@ -0,0 +1,253 @@
+import numpy
+
+import channelbake
+import channelmodel
+import keyframeutils
+import rotmath
+
+try:
+    import hou
+except ImportError:
+    # channelmodel tuples can be reduced without a Houdini session
+    hou = None
+
+# Reduces densely keyed (e.g. baked) parm tuples down to the fewest keys that reproduce the original curves within a
+# tolerance.
+#
+# Starting from keys on the first and last frame, the curves are rebuilt from the current keys and every segment whose
+# worst frame is off by more than the tolerance gets a new key on that frame. This repeats until every segment fits.
+# All components of a tuple share the same key frames, and complete rotates are measured by the angle between the
+# original and rebuilt orientations rather than per component, so a reduced rotation never drifts further than
+# rotate_tolerance degrees.
+#
+# With slopes="explicit" keys are written with the cubic() function and the slope of the original curve, which the
+# rebuilt curves match exactly. slopes="auto" writes regular auto-sloped keys. The fit can only estimate the slopes
+# Houdini computes for them, so after writing the curves are baked again and every segment still out of tolerance gets
+# another key, until all of them fit. Auto keys still follow the original curve less closely than explicit ones, so
+# expect noticeably more keys.
+
+
+def _keySlopes(t, v, keys, explicit):
+    """slopes at each key, t is (frames,), v is (frames, components) and keys are sorted indices into them"""
+    if explicit:
+        return numpy.gradient(v, t, axis=0)[keys]
+
+    kt = t[keys]
+    kv = v[keys]
+
+    if len(keys) < 3:
+        slope = (kv[-1] - kv[0]) / (kt[-1] - kt[0])
+        return numpy.repeat(slope[None, :], len(keys), axis=0)
+
+    slopes = numpy.empty_like(kv)
+    slopes[1:-1] = (kv[2:] - kv[:-2]) / (kt[2:] - kt[:-2])[:, None]
+    slopes[0] = (kv[1] - kv[0]) / (kt[1] - kt[0])
+    slopes[-1] = (kv[-1] - kv[-2]) / (kt[-1] - kt[-2])
+
+    return slopes
+
+
+def _hermite(t, keys, kv, km):
+    """evaluate the curves through the keys (values kv, slopes km) at every frame in t"""
+    kt = t[keys]
+
+    seg = numpy.clip(numpy.searchsorted(kt, t, side="right") - 1, 0, len(keys) - 2)
+
+    t0 = kt[seg]
+    h = kt[seg + 1] - t0
+    u = ((t - t0) / h)[:, None]
+    h = h[:, None]
+
+    u2 = u * u
+    u3 = u2 * u
+
+    return ((2 * u3 - 3 * u2 + 1) * kv[seg] +
+            (u3 - 2 * u2 + u) * h * km[seg] +
+            (-2 * u3 + 3 * u2) * kv[seg + 1] +
+            (u3 - u2) * h * km[seg + 1])
+
+
+def _errors(values, rebuilt, rotate=False, order="xyz"):
+    """(frames,) error of the rebuilt curves, in degrees between orientations for rotates"""
+    if rotate:
+        return rotmath.quatAngle(rotmath.eulerToQuat(values, order), rotmath.eulerToQuat(rebuilt, order))
+    return numpy.max(numpy.abs(values - rebuilt), axis=-1)
+
+
+def _worstFrames(keys, err, tolerance):
+    """the worst frame of every segment between keys that is out of tolerance"""
+    count = len(err)
+
+    # the keyed frames themselves never count as an error
+    err = err.copy()
+    err[keys] = 0.0
+
+    seg = numpy.searchsorted(keys, numpy.arange(count), side="right") - 1
+    ranked = numpy.lexsort((err, seg))
+    last = numpy.ones(count, dtype=bool)
+    last[:-1] = seg[ranked][1:] != seg[ranked][:-1]
+    worst = ranked[last]
+
+    return worst[err[worst] > tolerance]
+
+
+def fitKeys(frames, values, tolerance=0.01, rotate=False, explicit=True, max_iterations=100, order="xyz"):
+    """Find the fewest keys that reproduce values within tolerance.
+
+    frames
+        (frames,) array of ascending frames
+    values
+        (frames, components) array, for rotate=True the components are euler rotates in the given rotate order and
+        tolerance is in degrees
+
+    Returns the indices of the frames to key and the slopes at those keys, shape (keys, components)."""
+
+    t = numpy.asarray(frames, dtype=float)
+    v = numpy.asarray(values, dtype=float)
+
+    if v.ndim == 1:
+        v = v[:, None]
+
+    count = len(t)
+
+    if count < 3:
+        keys = numpy.arange(count)
+        return keys, numpy.zeros((count, v.shape[1]))
+
+    keys = numpy.array((0, count - 1))
+
+    for _ in range(max_iterations):
+        slopes = _keySlopes(t, v, keys, explicit)
+        rebuilt = _hermite(t, keys, v[keys], slopes)
+
+        worst = _worstFrames(keys, _errors(v, rebuilt, rotate, order), tolerance)
+
+        if not len(worst):
+            break
+
+        keys = numpy.union1d(keys, worst)
+
+    return keys, _keySlopes(t, v, keys, explicit)
+
+
+def _writeReduced(tup, frames, values, keys, slopes, explicit):
+    """Returns the number of keys written. Locked components and components without keys in the range are skipped"""
+    start = frames[0]
+    end = frames[-1]
+    count = 0
+
+    for idx, p in enumerate(tup):
+        if p.isLocked():
+            continue
+
+        # fitKeys() works in frames, keyframe slopes are per second
+        fps = p.fps if isinstance(p, channelmodel.Channel) else hou.fps()
+
+        # keep whatever lies outside of the reduced range
+        existing = p.keyframes()
+        outside = tuple(k for k in existing if k.frame() < start or k.frame() > end)
+
+        if len(outside) == len(existing):
+            continue
+
+        new_keys = ()
+
+        for k_idx, f_idx in enumerate(keys):
+            key = keyframeutils.newKeyframe(p)
+            key.setFrame(frames[f_idx])
+            key.setValue(float(values[f_idx, idx]))
+
+            if explicit:
+                key.setExpression("cubic()", keyframeutils.HSCRIPT)
+                key.setInSlope(float(slopes[k_idx, idx]) * fps)
+                key.setSlope(float(slopes[k_idx, idx]) * fps)
+            else:
+                key.setInSlopeAuto(True)
+                key.setSlopeAuto(True)
+
+            new_keys += (key,)
+
+        p.deleteAllKeyframes()
+        p.setKeyframes(outside + new_keys)
+        count += len(new_keys)
+
+    return count
+
+
+def reduceParmTuples(tuples=None, frames=None, tolerance=0.01, rotate_tolerance=0.1, slopes="explicit", bake=None,
+                     max_iterations=100):
+    """Replace the keys of the given parm tuples within frames with the fewest keys that stay within tolerance.
+
+    tuples
+        a sequence of hou.ParmTuple (or channelmodel.ChannelTuple)
+    frames
+        the frames to sample, e.g. range(1001, 1101), keys outside of this range are left untouched
+    tolerance
+        the maximum value error for regular tuples
+    rotate_tolerance
+        the maximum error in degrees for tuples where keyframeutils.isCompleteRotate() is True
+    slopes
+        "explicit" or "auto", see the notes at the top of this file
+    bake
+        an existing channelbake.ChannelBake to reduce instead of tuples and frames, pass either one or the other
+    max_iterations
+        how often auto-sloped curves are checked and refined after writing them
+
+    Explicit keys are written once per parm, auto keys once per round of checking, all within one undo group.
+    Returns the number of keys written."""
+
+    if slopes not in ("explicit", "auto"):
+        raise ValueError("slopes must be either 'explicit' or 'auto'")
+
+    if bake is None:
+        if tuples is None or frames is None:
+            raise ValueError("pass either tuples and frames or a bake")
+        bake = channelbake.bakeParmTuples(tuples, frames)
+    elif tuples is not None or frames is not None:
+        raise ValueError("a bake already holds the tuples and frames, pass either tuples and frames or a bake")
+
+    explicit = slopes == "explicit"
+
+    # [tuple, values, keys, slopes, rotate, rotate order, tolerance]
+    items = ()
+
+    for tup in bake.tuples:
+        values = bake.tupleValues(tup)
+        rotate = keyframeutils.isCompleteRotate(tup)
+        order = keyframeutils.rotateOrder(tup) if rotate else "xyz"
+        tol = rotate_tolerance if rotate else tolerance
+
+        keys, key_slopes = fitKeys(bake.frames, values, tol, rotate=rotate, explicit=explicit, order=order)
+        items += ([tup, values, keys, key_slopes, rotate, order, tol],)
+
+    # tuple index -> keys written
+    counts = {}
+
+    with keyframeutils.undoGroup("Reduce Keys"):
+        pending = tuple(enumerate(items))
+
+        for _ in range(max_iterations):
+            for idx, item in pending:
+                counts[idx] = _writeReduced(item[0], bake.frames, item[1], item[2], item[3], explicit)
+
+            if explicit:
+                break
+
+            # Houdini computes the auto slopes, key whatever the written curves still miss
+            check = channelbake.bakeParmTuples(tuple(item[0] for i, item in pending), bake.frames,
+                                               callback=lambda fraction: True)
+            refine = ()
+
+            for idx, item in pending:
+                worst = _worstFrames(item[2], _errors(item[1], check.tupleValues(item[0]), item[4], item[5]), item[6])
+                if len(worst):
+                    item[2] = numpy.union1d(item[2], worst)
+                    refine += ((idx, item),)
+
+            pending = refine
+            if not pending:
+                break
+
+    keyframeutils.keysChanged(p for tup in bake.tuples for p in tup)
+
+    return sum(counts.values())
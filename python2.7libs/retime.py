@@ -0,0 +1,174 @@
+import numpy
+
+import keyframeutils
+
+# Batched retiming of keys on many parms at once. Every operation comes down to a time-warp, a function mapping an
+# array of frames to their new frames:
+#
+# retime.offsetParmTuples(tuples, 10)                             -> push everything 10 frames later
+# retime.scaleParmTuples(tuples, 0.5, pivot=1001)                 -> play twice as fast from 1001
+# retime.remapParmTuples(tuples, (1001, 1050), (1001, 1080))      -> piecewise linear remap
+# retime.retimeParmTuples(tuples, retime.curveWarp(some_parm))    -> remap through an animated channel
+#
+# Only keys within ranges (all keys when ranges is None) are moved. When a key lands on a frame that already holds a
+# key, collisions decides which one survives:
+#
+# "moved"       moved keys replace untouched keys. Where several moved keys land on one frame, the one that came from
+#               the latest frame wins
+# "untouched"   untouched keys are kept and the moved key is dropped
+# "error"       raise a keyframeutils.Error (hou.Error) before anything is written
+#
+# Non-auto slopes and accelerations are rescaled by the local speed of the warp so curve shapes stretch with the keys.
+#
+# channelmodel channels and channel tuples are retimed the same way as live parms, hou isn't needed for them.
+
+COLLISIONS = ("moved", "untouched", "error")
+
+
+def curveWarp(parm):
+    """a warp that remaps frames through the value of an animated parm"""
+    def _warp(frames):
+        return numpy.array([parm.evalAtFrame(f) for f in frames], dtype=float)
+    return _warp
+
+
+def _speed(warp, frames):
+    """local derivative of the warp at each frame"""
+    return (warp(frames + 0.5) - warp(frames - 0.5))
+
+
+def _inRanges(frames, ranges):
+    if ranges is None:
+        return numpy.ones(len(frames), dtype=bool)
+
+    mask = numpy.zeros(len(frames), dtype=bool)
+    for start, end in ranges:
+        mask |= (frames >= start) & (frames <= end)
+
+    return mask
+
+
+def _rescale(key, speed):
+    if speed == 0.0:
+        return
+
+    if key.isSlopeUsed():
+        if not key.isSlopeAuto():
+            key.setSlope(key.slope() / speed)
+        if not key.isInSlopeAuto():
+            key.setInSlope(key.inSlope() / speed)
+
+    if key.isAccelUsed():
+        key.setAccel(key.accel() * abs(speed))
+        key.setInAccel(key.inAccel() * abs(speed))
+
+
+def _planParm(p, warp, ranges, snap, collisions):
+    keys = p.keyframes()
+
+    if not keys:
+        return None
+
+    frames = numpy.array([k.frame() for k in keys], dtype=float)
+    moving = _inRanges(frames, ranges)
+
+    if not moving.any():
+        return None
+
+    new_frames = frames.copy()
+    new_frames[moving] = warp(frames[moving])
+
+    if snap:
+        new_frames[moving] = numpy.floor(new_frames[moving] + 0.5)
+
+    speeds = numpy.ones(len(frames))
+    speeds[moving] = _speed(warp, frames[moving])
+
+    # frame -> (key, moved)
+    out = {}
+
+    for idx in range(len(keys)):
+        if not moving[idx]:
+            out[frames[idx]] = (keys[idx], False)
+
+    # walk moved keys by source frame so the latest one wins any collision between moved keys
+    for idx in numpy.argsort(frames):
+        if not moving[idx]:
+            continue
+
+        frame = float(new_frames[idx])
+        existing = out.get(frame)
+
+        if existing is not None and not existing[1]:
+            if collisions == "error":
+                raise keyframeutils.Error("retiming {0} moves the key at frame {1} onto the key at frame {2}".format(
+                    p.path(), frames[idx], frame))
+            if collisions == "untouched":
+                continue
+
+        key = keys[idx]
+        key.setFrame(frame)
+        _rescale(key, speeds[idx])
+        out[frame] = (key, True)
+
+    return p, tuple(out[f][0] for f in sorted(out))
+
+
+def retimeParmTuples(tuples, warp, ranges=None, snap=False, collisions="moved"):
+    """Move the keys of many parm tuples through a time-warp.
+
+    tuples
+        any mix of hou.Node, hou.ParmTuple and hou.Parm, or their channelmodel stand-ins
+    warp
+        a function taking a numpy array of frames and returning their new frames
+    ranges
+        optional sequence of (start, end) frame ranges, only keys within them are moved
+    snap
+        round moved keys to whole frames
+    collisions
+        one of COLLISIONS, see the notes at the top of this file
+
+    All moves are planned before anything is written, then every affected parm is rewritten once, all within one
+    undo group. Returns the number of parms written."""
+
+    if collisions not in COLLISIONS:
+        raise ValueError("collisions must be one of " + ", ".join(COLLISIONS))
+
+    plan = ()
+
+    for p in keyframeutils.parmsOf(tuples):
+        result = _planParm(p, warp, ranges, snap, collisions)
+        if result is not None:
+            plan += (result,)
+
+    with keyframeutils.undoGroup("Retime Keys"):
+        for p, keys in plan:
+            p.deleteAllKeyframes()
+            p.setKeyframes(keys)
+
+    keyframeutils.keysChanged(p for p, keys in plan)
+
+    return len(plan)
+
+
+def offsetParmTuples(tuples, offset, ranges=None, snap=False, collisions="moved"):
+    return retimeParmTuples(tuples, lambda f: f + offset, ranges=ranges, snap=snap, collisions=collisions)
+
+
+def scaleParmTuples(tuples, scale, pivot=0.0, ranges=None, snap=False, collisions="moved"):
+    return retimeParmTuples(tuples, lambda f: pivot + (f - pivot) * scale, ranges=ranges, snap=snap,
+                            collisions=collisions)
+
+
+def remapParmTuples(tuples, src_frames, dst_frames, ranges=None, snap=False, collisions="moved"):
+    """piecewise linear remap, frames outside of src_frames are offset along with the nearest end"""
+    src = numpy.asarray(src_frames, dtype=float)
+    dst = numpy.asarray(dst_frames, dtype=float)
+
+    def _warp(frames):
+        out = numpy.interp(frames, src, dst)
+        out = numpy.where(frames < src[0], frames + (dst[0] - src[0]), out)
+        out = numpy.where(frames > src[-1], frames + (dst[-1] - src[-1]), out)
+        return out
+
+    return retimeParmTuples(tuples, _warp, ranges=ranges, snap=snap, collisions=collisions)
@@ -0,0 +1,215 @@
+import numpy
+
+# numpy rotation maths for arrays of rotations, the batched counterpart of hou.hmath.buildRotate() and hou.Quaternion.
+#
+# Euler rotates are (N, 3) arrays in degrees, in the component order of a node's r parm tuple, whatever its rotate
+# order. Rotate orders are the strings used by the rOrd parm ("xyz", "zxy", ...), the first axis is applied first.
+# Quaternions are (N, 4) arrays stored as (x, y, z, w), matrices are (N, 3, 3) and act on column vectors, so they are
+# the transpose of the matching hou.Matrix3.
+
+ORDERS = ("xyz", "xzy", "yxz", "yzx", "zxy", "zyx")
+
+_AXES = {"x": 0, "y": 1, "z": 2}
+
+
+def _axes(order):
+    if order not in ORDERS:
+        raise ValueError("unknown rotate order: " + str(order))
+    return tuple(_AXES[c] for c in order)
+
+
+def _parity(i, j):
+    """1 if the axes i, j run in cyclic (x -> y -> z) order, otherwise -1"""
+    return 1.0 if (j - i) % 3 == 1 else -1.0
+
+
+def axisQuat(axis, angles):
+    """quaternions rotating by angles (degrees) around the given axis index"""
+    half = numpy.radians(angles) * 0.5
+
+    q = numpy.zeros((len(half), 4))
+    q[:, axis] = numpy.sin(half)
+    q[:, 3] = numpy.cos(half)
+
+    return q
+
+
+def quatMultiply(a, b):
+    """hamilton product a * b, i.e. b is applied first"""
+    ax, ay, az, aw = a[..., 0], a[..., 1], a[..., 2], a[..., 3]
+    bx, by, bz, bw = b[..., 0], b[..., 1], b[..., 2], b[..., 3]
+
+    return numpy.stack((
+        aw * bx + ax * bw + ay * bz - az * by,
+        aw * by - ax * bz + ay * bw + az * bx,
+        aw * bz + ax * by - ay * bx + az * bw,
+        aw * bw - ax * bx - ay * by - az * bz
+    ), axis=-1)
+
+
+def eulerToQuat(rot, order="xyz"):
+    rot = numpy.atleast_2d(numpy.asarray(rot, dtype=float))
+    i, j, k = _axes(order)
+
+    return quatMultiply(axisQuat(k, rot[:, k]), quatMultiply(axisQuat(j, rot[:, j]), axisQuat(i, rot[:, i])))
+
+
+def quatToMatrix(q):
+    q = numpy.atleast_2d(numpy.asarray(q, dtype=float))
+    x, y, z, w = q[:, 0], q[:, 1], q[:, 2], q[:, 3]
+
+    m = numpy.empty((len(q), 3, 3))
+
+    m[:, 0, 0] = 1.0 - 2.0 * (y * y + z * z)
+    m[:, 0, 1] = 2.0 * (x * y - z * w)
+    m[:, 0, 2] = 2.0 * (x * z + y * w)
+    m[:, 1, 0] = 2.0 * (x * y + z * w)
+    m[:, 1, 1] = 1.0 - 2.0 * (x * x + z * z)
+    m[:, 1, 2] = 2.0 * (y * z - x * w)
+    m[:, 2, 0] = 2.0 * (x * z - y * w)
+    m[:, 2, 1] = 2.0 * (y * z + x * w)
+    m[:, 2, 2] = 1.0 - 2.0 * (x * x + y * y)
+
+    return m
+
+
+def matrixToQuat(m):
+    m = numpy.asarray(m, dtype=float).reshape(-1, 3, 3)
+
+    # pick the numerically safest branch per matrix
+    trace = m[:, 0, 0] + m[:, 1, 1] + m[:, 2, 2]
+    diag = numpy.stack((m[:, 0, 0], m[:, 1, 1], m[:, 2, 2], trace), axis=-1)
+    branch = numpy.argmax(diag, axis=-1)
+
+    q = numpy.empty((len(m), 4))
+
+    for b in range(4):
+        sel = branch == b
+        if not sel.any():
+            continue
+
+        s = m[sel]
+
+        if b == 3:
+            r = numpy.sqrt(1.0 + trace[sel]) * 2.0
+            q[sel] = numpy.stack((
+                (s[:, 2, 1] - s[:, 1, 2]) / r,
+                (s[:, 0, 2] - s[:, 2, 0]) / r,
+                (s[:, 1, 0] - s[:, 0, 1]) / r,
+                0.25 * r
+            ), axis=-1)
+        else:
+            i = b
+            j = (i + 1) % 3
+            k = (i + 2) % 3
+            r = numpy.sqrt(1.0 + s[:, i, i] - s[:, j, j] - s[:, k, k]) * 2.0
+
+            out = numpy.empty((len(s), 4))
+            out[:, i] = 0.25 * r
+            out[:, j] = (s[:, j, i] + s[:, i, j]) / r
+            out[:, k] = (s[:, k, i] + s[:, i, k]) / r
+            out[:, 3] = (s[:, k, j] - s[:, j, k]) / r
+            q[sel] = out
+
+    return q / numpy.linalg.norm(q, axis=-1)[:, None]
+
+
+def eulerToMatrix(rot, order="xyz"):
+    return quatToMatrix(eulerToQuat(rot, order))
+
+
+def matrixToEuler(m, order="xyz"):
+    m = numpy.asarray(m, dtype=float).reshape(-1, 3, 3)
+    i, j, k = _axes(order)
+    s = _parity(i, j)
+
+    out = numpy.empty((len(m), 3))
+    out[:, j] = numpy.arcsin(numpy.clip(-s * m[:, k, i], -1.0, 1.0))
+
+    # away from gimbal lock the first and last angles are independent
+    cos_j = numpy.sqrt(m[:, i, i] ** 2 + (m[:, j, i]) ** 2)
+    locked = cos_j < 1e-6
+
+    out[:, i] = numpy.where(locked,
+                            numpy.arctan2(-s * m[:, j, k], m[:, j, j]),
+                            numpy.arctan2(s * m[:, k, j], m[:, k, k]))
+    out[:, k] = numpy.where(locked, 0.0, numpy.arctan2(s * m[:, j, i], m[:, i, i]))
+
+    return numpy.degrees(out)
+
+
+def quatToEuler(q, order="xyz"):
+    return matrixToEuler(quatToMatrix(q), order)
+
+
+def slerp(q1, q2, bias):
+    """spherical interpolation between matching rows of q1 and q2, bias can be a scalar or one value per row"""
+    q1 = numpy.atleast_2d(numpy.asarray(q1, dtype=float))
+    q2 = numpy.atleast_2d(numpy.asarray(q2, dtype=float))
+    bias = numpy.broadcast_to(numpy.asarray(bias, dtype=float), (len(q1),))
+
+    dot = numpy.sum(q1 * q2, axis=-1)
+
+    # take the shortest path
+    q2 = numpy.where((dot < 0.0)[:, None], -q2, q2)
+    dot = numpy.abs(dot)
+
+    theta = numpy.arccos(numpy.clip(dot, -1.0, 1.0))
+    sin_theta = numpy.sin(theta)
+
+    # fall back to a normalized lerp where the quaternions are nearly parallel
+    near = sin_theta < 1e-6
+    safe = numpy.where(near, 1.0, sin_theta)
+
+    w1 = numpy.where(near, 1.0 - bias, numpy.sin((1.0 - bias) * theta) / safe)
+    w2 = numpy.where(near, bias, numpy.sin(bias * theta) / safe)
+
+    out = q1 * w1[:, None] + q2 * w2[:, None]
+
+    return out / numpy.linalg.norm(out, axis=-1)[:, None]
+
+
+def quatAngle(q1, q2):
+    """angle in degrees between matching rows of q1 and q2"""
+    dot = numpy.abs(numpy.sum(q1 * q2, axis=-1))
+    return numpy.degrees(2.0 * numpy.arccos(numpy.clip(dot, 0.0, 1.0)))
+
+
+def _nearest(angles, ref):
+    """shift angles by whole turns so they lie within 180 degrees of ref"""
+    return angles - numpy.round((angles - ref) / 360.0) * 360.0
+
+
+def closestEuler(rot, ref, order="xyz"):
+    """Of all euler rotates equivalent to each row of rot, return the one closest to the matching row of ref.
+
+    The candidates are each row shifted by whole turns, and the alternate solution (first + 180, 180 - middle,
+    last + 180) shifted the same way. The orientations are unchanged, only their euler representation."""
+
+    rot = numpy.atleast_2d(numpy.asarray(rot, dtype=float))
+    ref = numpy.atleast_2d(numpy.asarray(ref, dtype=float))
+    i, j, k = _axes(order)
+
+    alt = rot.copy()
+    alt[:, i] += 180.0
+    alt[:, j] = 180.0 - alt[:, j]
+    alt[:, k] += 180.0
+
+    a = _nearest(rot, ref)
+    b = _nearest(alt, ref)
+
+    use_alt = numpy.sum(numpy.abs(b - ref), axis=-1) < numpy.sum(numpy.abs(a - ref), axis=-1)
+
+    return numpy.where(use_alt[:, None], b, a)
+
+
+def eulerFilter(rot, order="xyz"):
+    """Remove flips from a sequence of euler rotates, e.g. a baked rotation channel, by replacing every row with
+    the closestEuler() to the previous, already filtered, row."""
+
+    rot = numpy.array(rot, dtype=float, copy=True)
+
+    for f in range(1, len(rot)):
+        rot[f] = closestEuler(rot[f], rot[f - 1], order)[0]
+
+    return rot
@@ -1,34 +1,20 @@
-def moveBoneTip(bone, pos, compensate=True):
-
-	xform = bone.worldTransform()
-	children = bone.outputs()
-	child_xforms = []
-	grandchild_xforms = []
-
-	for c in children:
-		child_xforms.append(c.worldTransform())
-		grandchild_xforms.append(tuple(gc.worldTransform() for gc in c.outputs()))
-
+import hou
 
-	start_tip = hou.Vector3((0,0,-bone.evalParm("length"))) * xform
-	root = xform.extractTranslates()
+import Skeleton
 
-	diff_m = hou.hmath.buildTranslate(pos - start_tip)
 
-	goal_dir = (pos - root).normalized()
-
-	rot = hou.Vector3((0,0,-1)).matrixToRotateTo(goal_dir.multiplyAsDir(xform.inverted()))
-
-	bone.setWorldTransform(rot * xform)
-
-	bone.parm("length").set((pos - root).length())
+def moveBoneTip(bone, pos, compensate=True):
+	"""Move the tip of bone (a hou.ObjNode) to pos. With compensate every child bone keeps its tip in place,
+	otherwise the children follow. See Skeleton.Skeleton.fit() to refit many joints at once."""
 
-	for idx, c in enumerate(children):
-		if c.type().name() != "bone":
-			continue
+	children = tuple(c for c in bone.outputs() if c.type().name() == "bone")
+	# grandchildren are fitted too, so they keep their world transforms when the children turn
+	grandchildren = tuple(gc for c in children for gc in c.outputs() if gc.type().name() == "bone")
 
-		start_tip = hou.Vector3((0,0,-c.evalParm("length"))) * xform
-		goal_dir = (start_tip - pos).normalized()
-		rot = hou.Vector3((0,0,-1)).matrixToRotateTo(goal_dir.multiplyAsDir(child_xforms[idx].inverted()))
+	nodes = (bone,) + children + (grandchildren if compensate else ())
 
-		bone2.setWorldTransform(rot * child_xforms[idx] * diff_m)
+	skel = Skeleton.Skeleton(nodes)
+	try:
+		skel.fit({bone: hou.Vector3(pos)}, compensate)
+	finally:
+		skel.release()